@@ -65,11 +65,35 @@ settings = _(
         os.path.dirname(os.path.abspath(__file__)),
         'templates'), ],
     multiprocess=4,
+    render_multiprocess=None,
+    # 'fork', 'spawn' or 'forkserver'. fork starts workers fastest where
+    # it is available; spawn is the only one on Windows.
+    pool_start_method='fork',
     log_level=logging.INFO,
     dir=_(
-        output='~/Desktop/biisan'
+        output='~/Desktop/biisan',
+        cache='.biisan_cache',
     ),
     timezone=timezone(timedelta(hours=0, minutes=0)),
     custom_filters={},
     template_functions={},
+    docutils_report_level=2,
+    docutils_halt_level=6,
+    docutils_quiet_warnings=False,
+    parse_cache=True,
+    incremental=True,
+    lightweight_stories=False,
+    rst_frontend='xml',
+    markdown_frontend='xml',
+    processor_profile=False,
+    native_renderers=False,
+    template_bytecode_cache=True,
+    fragment_cache=True,
+    output_cache=True,
+    output_cache_max_entries=200000,
+    stat_manifest=True,
+    watch_backend='auto',
+    watch_interval=0.5,
+    serve_cache_size=256,
+    metadata_scan=False,
 )
@@ -0,0 +1,124 @@
+"""
+Dependency tracking for incremental builds.
+
+Every generated file is recorded with a signature computed from the inputs
+that produced it: the templates it renders (including everything they
+extend, include or import), the settings, and the source digests of the
+stories shown on the page. When the signature matches the previous build and
+the file still exists, the page is not rendered again.
+"""
+import json
+import logging
+import os
+
+from jinja2 import meta
+from jinja2.exceptions import TemplateNotFound
+
+import biisan
+from biisan.cache import fingerprint
+
+
+logger = logging.getLogger(__name__)
+
+COMPONENTS_PREFIX = 'components/'
+
+
+def templates_digest(env, names):
+    sources = []
+    for name in sorted(names):
+        source, _, _ = env.loader.get_source(env, name)
+        sources.append((name, source))
+    return fingerprint(sources)
+
+
+def components_digest(env):
+    """
+    Story bodies pick component templates by class name at render time,
+    so anything rendered from a story body depends on every component
+    template.
+    """
+    return templates_digest(
+        env, (x for x in env.list_templates() if x.startswith(COMPONENTS_PREFIX)))
+
+
+class BuildGraph(object):
+    """
+    Signatures of the generated files. With path None, nothing is loaded
+    or saved and the graph only computes signatures.
+    """
+
+    def __init__(self, path, env, settings):
+        self.path = path
+        self.env = env
+        self.settings_digest = fingerprint(biisan.__version__, settings)
+        self._template_digests = {}
+        self._components_digest = None
+        self._previous = self._load()
+        self._current = {}
+
+    def _load(self):
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning('Ignore broken build graph: %s', self.path)
+            return {}
+
+    def _referenced_templates(self, name):
+        source, _, _ = self.env.loader.get_source(self.env, name)
+        return source, list(meta.find_referenced_templates(self.env.parse(source)))
+
+    def template_digest(self, name):
+        """
+        Digest of the template and every template it references.
+        A dynamic reference makes the template depend on all templates.
+        """
+        if name in self._template_digests:
+            return self._template_digests[name]
+        self._template_digests[name] = None  # guard against cycles
+        try:
+            source, references = self._referenced_templates(name)
+        except TemplateNotFound:
+            digest = fingerprint(name, None)
+        else:
+            if None in references:
+                dependencies = [self.all_templates_digest()]
+            else:
+                dependencies = [self.template_digest(x) for x in references]
+            digest = fingerprint(name, source, dependencies)
+        self._template_digests[name] = digest
+        return digest
+
+    def all_templates_digest(self):
+        return templates_digest(self.env, self.env.list_templates())
+
+    def components_digest(self):
+        if self._components_digest is None:
+            self._components_digest = components_digest(self.env)
+        return self._components_digest
+
+    def signature(self, template_name, *inputs):
+        return fingerprint(
+            self.settings_digest, self.template_digest(template_name), inputs)
+
+    def is_fresh(self, output_file, signature):
+        return (self._previous.get(output_file) == signature and
+                os.path.exists(output_file))
+
+    def record(self, output_file, signature):
+        self._current[output_file] = signature
+
+    def save(self):
+        graph = dict(self._previous)
+        graph.update(self._current)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = '{0}.tmp'.format(self.path)
+        with open(tmp_path, 'w', encoding='utf8') as f:
+            json.dump(graph, f, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self._previous = graph
+        self._current = {}
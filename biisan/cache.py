@@ -0,0 +1,327 @@
+"""
+On-disk caches shared between biisan builds.
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import threading
+from collections import namedtuple
+
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of cached objects changes incompatibly.
+CACHE_FORMAT = 3
+
+
+def stable_repr(obj):
+    """
+    repr() that does not depend on memory addresses or dict ordering,
+    so it can be used to fingerprint settings across processes.
+    """
+    if isinstance(obj, dict):
+        return '{' + ', '.join(
+            '{0}: {1}'.format(stable_repr(k), stable_repr(v))
+            for k, v in sorted(obj.items(), key=lambda x: repr(x[0]))) + '}'
+    if isinstance(obj, (list, tuple)):
+        return '[' + ', '.join(stable_repr(x) for x in obj) + ']'
+    if callable(obj) and hasattr(obj, '__qualname__'):
+        return '{0}.{1}'.format(getattr(obj, '__module__', ''), obj.__qualname__)
+    return repr(obj)
+
+
+def fingerprint(*parts):
+    return hashlib.sha256(
+        '\0'.join(stable_repr(part) for part in parts).encode('utf8')
+    ).hexdigest()
+
+
+class DiskCache(object):
+    """
+    Pickle store keyed by content digest.
+
+    ``salt`` is mixed into every key so entries written under a different
+    biisan version or configuration are never returned.
+    """
+
+    def __init__(self, directory, salt=''):
+        self.directory = directory
+        self.salt = salt
+
+    def key_for(self, digest):
+        return hashlib.sha256(
+            '{0}\0{1}'.format(self.salt, digest).encode('utf8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key, default=None):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return default
+        except Exception as e:
+            logger.warning('Ignore broken cache entry %s: %s', key, e)
+            return default
+
+    def set(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+    def stats(self):
+        """
+        Returns:
+            tuple: (number of entries, bytes on disk)
+        """
+        return directory_stats(self.directory)
+
+
+def directory_stats(directory):
+    """
+    Returns:
+        tuple: (number of files under directory, their total bytes)
+    """
+    entries = size = 0
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                continue
+            entries += 1
+    return entries, size
+
+
+# What the output cache remembers about a generated file: the digest of the
+# markup it was written from, and the size and mtime of the file written.
+OutputEntry = namedtuple('OutputEntry', ['digest', 'size', 'mtime_ns'])
+
+
+class OutputCache(object):
+    """
+    OutputEntry of each generated file, kept in one sqlite database
+    outside the output directory.
+
+    Only the build process opens the database: it looks entries up before
+    handing pages to pool workers and stores the entries the workers send
+    back. Changes are kept in memory until ``flush()`` writes them in one
+    transaction and drops the least recently used entries beyond
+    ``max_entries``.
+    """
+
+    def __init__(self, path, max_entries=None):
+        self.path = path
+        self.max_entries = max_entries
+        self._connection = None
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def _connect(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS outputs ('
+                'path TEXT PRIMARY KEY, digest TEXT NOT NULL, size INTEGER NOT NULL, '
+                'mtime_ns INTEGER NOT NULL, used INTEGER NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS outputs_used ON outputs (used)')
+            self._connection = connection
+        return self._connection
+
+    def get(self, output_file):
+        """
+        Returns:
+            OutputEntry, or None when unknown
+        """
+        with self._lock:
+            entry = self._pending.get(output_file)
+            if entry is not None:
+                return entry
+            row = self._connect().execute(
+                'SELECT digest, size, mtime_ns FROM outputs WHERE path = ?',
+                (output_file,)).fetchone()
+        return None if row is None else OutputEntry(*row)
+
+    def set(self, output_file, entry):
+        with self._lock:
+            self._pending[output_file] = OutputEntry(*entry)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            connection = self._connect()
+            with connection:
+                if pending:
+                    used = (connection.execute(
+                        'SELECT MAX(used) FROM outputs').fetchone()[0] or 0) + 1
+                    connection.executemany(
+                        'INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?)',
+                        [(path,) + tuple(entry) + (used,) for path, entry in pending.items()])
+                if self.max_entries:
+                    connection.execute(
+                        'DELETE FROM outputs WHERE path IN (SELECT path FROM outputs '
+                        'ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def stats(self):
+        """
+        Returns:
+            tuple: (number of entries, bytes on disk)
+        """
+        with self._lock:
+            entries = self._connect().execute('SELECT COUNT(*) FROM outputs').fetchone()[0]
+        size = sum(
+            os.path.getsize(self.path + suffix)
+            for suffix in ('', '-journal') if os.path.exists(self.path + suffix))
+        return entries, size
+
+    def clear(self):
+        with self._lock:
+            with self._connect() as connection:
+                connection.execute('DELETE FROM outputs')
+            self._pending = {}
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+def _stat_key(st):
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+class StatManifest(object):
+    """
+    Source digests keyed by path, trusted while the file keeps the size,
+    mtime and inode it had when it was hashed, like git's index. So an
+    unchanged source is neither read nor hashed.
+
+    A file modified no earlier than the manifest was saved may have changed
+    again within the same timestamp, so its digest is not trusted.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._previous, self._saved_ns = self._load()
+        self._current = {}
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf8') as f:
+                return json.load(f), os.fstat(f.fileno()).st_mtime_ns
+        except FileNotFoundError:
+            return {}, 0
+        except ValueError:
+            logger.warning('Ignore broken stat manifest: %s', self.path)
+            return {}, 0
+
+    def digest(self, pth, st):
+        """
+        Args:
+            st: os.stat() result of pth, taken before the file is read
+
+        Returns:
+            str: digest recorded for pth, or None when it has to be hashed
+        """
+        entry = self._previous.get(pth)
+        if entry is None or entry[:3] != _stat_key(st) or st.st_mtime_ns >= self._saved_ns:
+            return None
+        return entry[3]
+
+    def record(self, pth, st, digest):
+        entry = _stat_key(st) + [digest]
+        if self._previous.get(pth) != entry or st.st_mtime_ns >= self._saved_ns:
+            self._current[pth] = entry
+
+    def save(self):
+        # Nothing to write when every digest could be trusted
+        if not self._current:
+            return
+        manifest = dict(self._previous)
+        manifest.update(self._current)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = '{0}.tmp'.format(self.path)
+        with open(tmp_path, 'w', encoding='utf8') as f:
+            json.dump(manifest, f, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self._previous, self._saved_ns = manifest, os.stat(self.path).st_mtime_ns
+        self._current = {}
+
+
+class RecordCache(object):
+    """
+    Story records read by the metadata scan, keyed by source digest, in a
+    single pickle file read on first use. With the stat manifest an
+    unchanged story's record is found without reading its source.
+    Records not used since the last save are dropped by the next one.
+    """
+
+    def __init__(self, path, salt=''):
+        self.path = path
+        self.salt = salt
+        self._previous = None
+        self._current = {}
+        self._changed = False
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning('Ignore broken record cache %s: %s', self.path, e)
+            return {}
+        if data.get('salt') != self.salt:
+            return {}
+        return data['records']
+
+    def get(self, digest):
+        if self._previous is None:
+            self._previous = self._load()
+        record = self._current.get(digest) or self._previous.get(digest)
+        if record is not None:
+            self._current[digest] = record
+        return record
+
+    def set(self, digest, record):
+        self._current[digest] = record
+        self._changed = True
+
+    def save(self):
+        # Untouched when no scan ran, e.g. in a build parsing every story
+        if self._previous is None and not self._changed:
+            return
+        if not self._changed and self._current.keys() == self._previous.keys():
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump({'salt': self.salt, 'records': self._current}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._previous, self._current, self._changed = self._current, {}, False
@@ -0,0 +1,200 @@
+"""
+biisan command line.
+
+    $ biisan compile-templates
+    $ biisan indexes
+    $ biisan cache stats
+    $ biisan cache clear
+    $ biisan watch
+    $ biisan serve --port 8000
+    $ biisan daemon
+    $ biisan build
+    $ biisan startup-report
+
+Run commands in the data directory with BIISAN_SETTINGS_MODULE set, as
+for ``python -m biisan.generate``.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+# Libraries biisan imports only when a file needs them
+LAZY_LIBRARIES = ('docutils', 'marko', 'yaml', 'css_html_js_minify', 'inquirer')
+
+
+def compile_templates(args):
+    from glueplate import config
+
+    from biisan.utils import compile_templates, template_bytecode_directory
+
+    if not config.settings.template_bytecode_cache:
+        sys.exit('template_bytecode_cache is disabled.')
+    names = compile_templates(config)
+    print('Compiled {0} templates into {1}'.format(
+        len(names), template_bytecode_directory(config)))
+
+
+def indexes(args):
+    from biisan.generate import main_indexes, prepare
+
+    prepare()
+    main_indexes()
+
+
+def _cache_directory():
+    from glueplate import config
+
+    return os.path.expanduser(config.settings.dir.cache)
+
+
+def cache_stats(args):
+    from biisan.cache import OutputCache, directory_stats
+    from biisan.generate import output_cache_path
+
+    directory = _cache_directory()
+    print('Cache directory: {0}'.format(os.path.abspath(directory)))
+    if not os.path.isdir(directory):
+        print('  (empty)')
+        return
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            entries, size = directory_stats(path)
+            print('  {0}: {1} files, {2} bytes'.format(name, entries, size))
+    if os.path.exists(output_cache_path()):
+        cache = OutputCache(output_cache_path())
+        entries, size = cache.stats()
+        cache.close()
+        print('  outputs: {0} entries, {1} bytes'.format(entries, size))
+    print('  total: {0} bytes'.format(directory_stats(directory)[1]))
+
+
+def cache_clear(args):
+    directory = _cache_directory()
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    print('Cleared {0}'.format(os.path.abspath(directory)))
+
+
+def watch(args):
+    from biisan.watch import watch
+
+    watch()
+
+
+def serve(args):
+    from biisan.serve import serve
+
+    serve(args.bind, args.port)
+
+
+def daemon(args):
+    from biisan.daemon import run
+
+    run()
+
+
+def build(args):
+    from biisan.daemon import request, socket_path
+
+    ok = None if args.no_daemon else request()
+    if ok is None:
+        from biisan.generate import main, prepare
+
+        if not args.no_daemon:
+            print('No build daemon on {0}, building in this process'.format(socket_path()), file=sys.stderr)
+        prepare()
+        main()
+    elif not ok:
+        sys.exit(1)
+
+
+def import_times(module):
+    """
+    Import module in a new interpreter with ``-X importtime``.
+
+    Returns:
+        list: (cumulative us, self us, name) of every imported module, in
+        import order
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import {0}'.format(module)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != 0:
+        sys.exit('Failed to import {0}:\n{1}'.format(module, result.stderr))
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            # the header line
+            continue
+        times.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return times
+
+
+def startup_report(args):
+    times = import_times(args.module)
+    total = next((x[0] for x in times if x[2].strip() == args.module), sum(x[1] for x in times))
+    print('import {0}: {1:.1f} ms, {2} modules'.format(args.module, total / 1000, len(times)))
+    print('{0:>10} {1:>10}  module'.format('cumul ms', 'self ms'))
+    for cumulative_us, self_us, name in sorted(times, reverse=True)[:args.limit]:
+        print('{0:>10.1f} {1:>10.1f}  {2}'.format(cumulative_us / 1000, self_us / 1000, name))
+    names = {x[2].strip() for x in times}
+    loaded = [x for x in LAZY_LIBRARIES if x in names]
+    print('Lazy libraries loaded: {0}'.format(', '.join(loaded) or 'none'))
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='biisan')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compile_parser = subparsers.add_parser(
+        'compile-templates',
+        help='compile all templates in template_dirs into the bytecode cache')
+    compile_parser.set_defaults(func=compile_templates)
+    indexes_parser = subparsers.add_parser(
+        'indexes',
+        help='rewrite index pages, feeds and sitemaps from story metadata only')
+    indexes_parser.set_defaults(func=indexes)
+    cache_parser = subparsers.add_parser(
+        'cache', help='show or clear the build caches under dir.cache')
+    cache_subparsers = cache_parser.add_subparsers(dest='cache_command', required=True)
+    cache_subparsers.add_parser(
+        'stats', help='show the size of each cache').set_defaults(func=cache_stats)
+    cache_subparsers.add_parser(
+        'clear', help='remove every cache, the next build renders everything').set_defaults(func=cache_clear)
+    watch_parser = subparsers.add_parser(
+        'watch', help='build, then rebuild whenever a story, extra page or template changes')
+    watch_parser.set_defaults(func=watch)
+    serve_parser = subparsers.add_parser(
+        'serve', help='preview the site, rendering each page when it is requested')
+    serve_parser.add_argument('--bind', default='127.0.0.1', help='address to listen on (default: %(default)s)')
+    serve_parser.add_argument('--port', type=int, default=8000, help='port to listen on (default: %(default)s)')
+    serve_parser.set_defaults(func=serve)
+    daemon_parser = subparsers.add_parser(
+        'daemon', help='keep libraries, templates, stories and workers loaded and build on request')
+    daemon_parser.set_defaults(func=daemon)
+    build_parser = subparsers.add_parser(
+        'build', help='build the site, with the build daemon when it is running')
+    build_parser.add_argument('--no-daemon', action='store_true', help='build in this process')
+    build_parser.set_defaults(func=build)
+    report_parser = subparsers.add_parser(
+        'startup-report', help='show the slowest imports of a biisan module, as python -X importtime reports them')
+    report_parser.add_argument(
+        'module', nargs='?', default='biisan.generate', help='module to import (default: %(default)s)')
+    report_parser.add_argument(
+        '--limit', type=int, default=20, help='number of modules to show (default: %(default)s)')
+    report_parser.set_defaults(func=startup_report)
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
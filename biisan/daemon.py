@@ -0,0 +1,184 @@
+"""
+Build daemon and its client.
+
+    $ biisan daemon
+    $ biisan build
+
+The daemon keeps everything a build needs between builds: the imported
+libraries, the settings, the registered directives and processors, the
+Jinja environment, the collected stories and the render workers. It
+listens on a Unix domain socket under dir.cache. ``biisan build`` asks
+it to build and prints the build log as the daemon writes it; without a
+daemon it builds in its own process.
+
+Messages are JSON, one per line. The client sends
+``{"command": "build"}``, the daemon answers with ``{"log": line}``
+messages and finally ``{"done": true, "ok": bool}``.
+"""
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+
+from glueplate import config
+
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = '%(levelname)s:%(name)s:%(message)s'
+
+
+def socket_path():
+    return os.path.join(os.path.expanduser(config.settings.dir.cache), 'daemon.sock')
+
+
+class _StreamHandler(logging.Handler):
+    # Sends log records to the client, from the render thread as well
+    def __init__(self, send):
+        super().__init__()
+        self.send = send
+        self.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    def emit(self, record):
+        self.send(log=self.format(record))
+
+
+class BuildRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline() or '{}')
+        except ValueError:
+            request = {}
+        if request.get('command') != 'build':
+            self._send(done=True, ok=False, log='Unknown request: {0!r}'.format(request))
+            return
+        handler = _StreamHandler(self._send)
+        biisan_logger = logging.getLogger('biisan')
+        # The client gets the log at log_level, whatever the daemon logs
+        level = biisan_logger.level
+        biisan_logger.setLevel(config.settings.log_level)
+        biisan_logger.addHandler(handler)
+        ok = False
+        try:
+            self.server.build()
+            ok = True
+        except Exception:
+            logger.exception('Build failed')
+        finally:
+            biisan_logger.removeHandler(handler)
+            biisan_logger.setLevel(level)
+        self._send(done=True, ok=ok)
+
+    def _send(self, **message):
+        try:
+            self.wfile.write((json.dumps(message) + '\n').encode('utf8'))
+        except OSError:
+            # The client went away, the build goes on
+            pass
+
+
+class BuildServer(socketserver.UnixStreamServer):
+    """
+    Builds one request at a time, in the thread serving requests.
+    """
+
+    def __init__(self, path, session, watcher):
+        self.session = session
+        self.watcher = watcher
+        super().__init__(path, BuildRequestHandler)
+
+    def build(self):
+        changed = self.watcher.changes()
+        if changed and self.session.read_changes(changed):
+            # Drops cached templates and restarts the workers
+            self.session.reload_templates()
+        self.session.build()
+
+
+def _remove_stale_socket(path):
+    if not os.path.exists(path):
+        return
+    if request(path, probe=True):
+        sys.exit('A build daemon is listening on {0} already.'.format(path))
+    os.remove(path)
+
+
+def create_server(path=None):
+    """
+    Collect the stories and start listening. The caller runs
+    serve_forever() and close() on the result.
+    """
+    from biisan import generate
+    from biisan.watch import Session, create_watcher, watched_directories
+
+    path = path or socket_path()
+    generate.prepare()
+    # Started before collecting, so changes made meanwhile are seen
+    watcher = create_watcher(watched_directories())
+    session = Session()
+    session.open_pool()
+    session.collect()
+    _remove_stale_socket(path)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    return BuildServer(path, session, watcher)
+
+
+def close(server):
+    server.server_close()
+    server.watcher.close()
+    server.session.close()
+    try:
+        os.remove(server.server_address)
+    except OSError:
+        pass
+
+
+def run(path=None):
+    """
+    Serve build requests until interrupted or terminated.
+    """
+    server = create_server(path)
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    logger.info('Build daemon listening on %s, press Ctrl-C to stop', server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close(server)
+
+
+def request(path=None, command='build', stream=None, probe=False):
+    """
+    Send a request to the daemon and print its log to stream.
+
+    Args:
+        probe: only check whether a daemon is listening
+
+    Returns:
+        bool: whether the request succeeded, None when no daemon listens
+    """
+    path = path or socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    with sock:
+        if probe:
+            return True
+        stream = stream or sys.stdout
+        sock.sendall((json.dumps({'command': command}) + '\n').encode('utf8'))
+        with sock.makefile('r', encoding='utf8') as f:
+            for line in f:
+                message = json.loads(line)
+                if 'log' in message:
+                    print(message['log'], file=stream, flush=True)
+                if message.get('done'):
+                    return message['ok']
+    # The daemon stopped in the middle of the build
+    return False
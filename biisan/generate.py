@@ -1,34 +1,56 @@
 import biisan
+import copy
 import os
-import codecs
 import hashlib
+import threading
 import time
-from collections import OrderedDict
-from glob import glob
 import logging
-from multiprocessing import Pool
+import multiprocessing
 from email.utils import formatdate
+from functools import partial
 from datetime import datetime
-import xml.etree.ElementTree as ET
 
-from css_html_js_minify import html_minify
-from docutils.core import publish_parts
-from docutils.parsers.rst import directives
 from glueplate import config
 
-from biisan.utils import get_klass, get_function, get_environment
+from biisan.build_graph import BuildGraph, components_digest
+from biisan.cache import CACHE_FORMAT, DiskCache, OutputCache, OutputEntry, RecordCache, StatManifest, fingerprint
+from biisan.models import StoryRecord, Title
+from biisan.output import OutputWriter, write_file
+from biisan.story_index import StoryIndex, latest, story_sort_key
+from biisan.utils import get_klass, get_function, get_environment, warm_templates
+from biisan import processors
 from biisan.processors import FunctionRegistry
-from biisan.markdown_processor import parse_markdown_to_xml
+
+# docutils, marko, yaml and css_html_js_minify are imported when the first
+# file needing them is seen, so commands and workers that never read a
+# reStructuredText or Markdown file start without them.
 
 logging.basicConfig(level=config.settings.log_level)
 logger = logging.getLogger(__name__)
 processor_registry = None
-_DOCUTILS_SILENT_STREAM = open(os.devnull, 'w')
+parse_cache = None
+build_graph = None
+fragment_cache = None
+output_cache = None
+stat_manifest = None
+record_cache = None
+output_writer = OutputWriter()
+_docutils_silent_stream = None
+_directives_registered = False
+STORY_EXTENSIONS = ('.rst', '.md')
+
+
+def _as_index(story_list):
+    if isinstance(story_list, StoryIndex):
+        return story_list
+    return StoryIndex(story_list)
 
 
-def __latest_stories(story_list):
-    cnt = config.settings.latest_list_count * -1 - 1
-    return story_list[:cnt:-1]
+def _silent_stream():
+    global _docutils_silent_stream
+    if _docutils_silent_stream is None:
+        _docutils_silent_stream = open(os.devnull, 'w')
+    return _docutils_silent_stream
 
 
 def _docutils_settings_overrides():
@@ -37,283 +59,912 @@ def _docutils_settings_overrides():
         'halt_level': getattr(config.settings, 'docutils_halt_level', 6),
     }
     if getattr(config.settings, 'docutils_quiet_warnings', False):
-        overrides['warning_stream'] = _DOCUTILS_SILENT_STREAM
+        overrides['warning_stream'] = _silent_stream()
     return overrides
 
 
-def unmarshal_story(pth):
+def html_minify(html):
+    from css_html_js_minify import html_minify as _html_minify
+    return _html_minify(html)
+
+
+def _parse_document(pth, data):
+    if pth.endswith('.md'):
+        # Parse Markdown to XML
+        from biisan.markdown_processor import parse_markdown_to_xml
+        return parse_markdown_to_xml(data)
+    elif pth.endswith('.rst'):
+        # Parse RST using this process's docutils publisher
+        from biisan.rst_processor import parse_rst_to_doctree, parse_rst_to_xml
+        if not _directives_registered:
+            register_directives()
+        if config.settings.rst_frontend == 'doctree':
+            return parse_rst_to_doctree(data, _docutils_settings_overrides())
+        return parse_rst_to_xml(data, _docutils_settings_overrides())
+    raise ValueError(f'Unsupported file format: {pth}. Only .rst and .md are supported.')
+
+
+def _cached_story(pth, digest):
+    if parse_cache is None:
+        return None
+    _story = parse_cache.get(parse_cache.key_for(digest))
+    if _story is not None:
+        logger.debug('Parse cache hit : {0}'.format(pth))
+        _story.source_file = pth
+    return _story
+
+
+def unmarshal_story(pth, digest=None, render_body=False):
     """
     Parse and unmarshal a story file (RST or Markdown).
 
+    When the parse cache is enabled, a story whose source and configuration
+    are unchanged since a previous build is loaded from the cache instead.
+
     Args:
         pth: Path to the story file (.rst or .md)
+        digest: digest of the source when already known, e.g. from the
+            stat manifest; a cached story is then loaded without reading
+            the source
+        render_body: also render the body of a parsed story into the
+            fragment cache
 
     Returns:
         Story object with parsed content
     """
-    story_class = get_klass(config.settings.story_class)
-    with codecs.open(pth, encoding='utf8') as f:
+    pth = os.fspath(pth)
+    if digest is not None:
+        _story = _cached_story(pth, digest)
+        if _story is not None:
+            return _story
+    with open(pth, 'rb') as f:
         logger.debug('Unmarshal : {0}'.format(pth))
-        data = f.read()
-
-        # Determine file type and parse accordingly
-        if pth.endswith('.md'):
-            # Parse Markdown to XML
-            document = parse_markdown_to_xml(data)
-
-        elif pth.endswith('.rst'):
-            # Parse RST to XML using docutils
-            parts = publish_parts(
-                data,
-                writer_name='xml',
-                settings_overrides=_docutils_settings_overrides(),
-            )
-            document = ET.fromstring(parts.get('whole'))
-        else:
-            raise ValueError(f'Unsupported file format: {pth}. Only .rst and .md are supported.')
+        raw = f.read()
+    known_digest, digest = digest, hashlib.sha256(raw).hexdigest()
+    if digest != known_digest:
+        _story = _cached_story(pth, digest)
+        if _story is not None:
+            return _story
 
-        _story = story_class()
-        _story.source_file = pth
+    story_class = get_klass(config.settings.story_class)
+    _story = story_class()
+    _story.source_file = pth
+    _story.source_digest = digest
+    if pth.endswith('.md') and config.settings.markdown_frontend == 'direct':
+        from biisan.markdown_direct import parse_markdown_to_story
+        parse_markdown_to_story(raw.decode('utf8'), _story)
+    else:
+        document = _parse_document(pth, raw.decode('utf8'))
         processor_registry.process(document, _story)
-        return _story
+    if parse_cache is not None:
+        parse_cache.set(parse_cache.key_for(digest), _story)
+    if render_body:
+        _render_body(_story)
+    return _story
+
+
+def _render_body(story):
+    # The body does not depend on the neighbours, so it can be rendered
+    # while other stories are still being parsed. The page, rendered once
+    # the order of all stories is known, takes it from the fragment cache.
+    if fragment_cache is None or not story.source_digest:
+        return
+    key = fragment_cache.key_for(story.source_digest)
+    if fragment_cache.get(key) is None:
+        fragment_cache.set(key, story.body_html)
 
 
 def extract_year_month(story_list):
-    result = OrderedDict()
-    for story in story_list:
-        _months = result.get(story.date.year, [])
-        _months.append(story.date.month)
-        result[story.date.year] = _months
-    for key in result.keys():
-        result[key] = sorted(list(set(result.get(key))))
-    return result
+    return _as_index(story_list).year_month
 
 
 def pack_story_to_year_month(story_list):
-    result = OrderedDict()
-    for story in story_list:
-        _year_month = '{0:04d}/{1:02d}'.format(
-            story.date.year, story.date.month)
-        _stories = result.get(_year_month, [])
-        _stories.append(story)
-        result[_year_month] = _stories
-    return result
+    return _as_index(story_list).by_year_month
+
+
+def unmarshal_record(pth, digest=None, render_body=False):
+    """
+    Parse a story file and keep only its StoryRecord.
+
+    The parsed Story stays in the parse cache, from where the render
+    stage loads it again.
+    """
+    return StoryRecord(unmarshal_story(pth, digest, render_body))
+
+
+def discover_documents(base_path):
+    """
+    Find story sources (.rst and .md) under base_path with a single
+    directory walk. Hidden files and directories are skipped, as glob does.
+
+    Returns:
+        Paths sorted by name, so stories with the same date keep a stable order
+    """
+    found = []
+    for dirpath, dirnames, filenames in os.walk(base_path, followlinks=True):
+        dirnames[:] = [x for x in dirnames if not x.startswith('.')]
+        for filename in filenames:
+            if not filename.startswith('.') and filename.endswith(STORY_EXTENSIONS):
+                found.append(os.path.join(dirpath, filename))
+    found.sort()
+    return found
+
+
+def _collect_one(func, item):
+    # Runs in a pool worker, returns the index so results can arrive unordered.
+    # Bodies are rendered here, overlapping with the parsing of other stories.
+    index, pth, digest = item
+    if processor_registry is not None and processor_registry.profiling:
+        processor_registry.reset_profile()
+        return index, func(pth, digest, render_body=True), processor_registry.profile_stats()
+    return index, func(pth, digest, render_body=True), None
+
+
+def _stat_sources(paths):
+    """
+    Returns:
+        tuple: (os.stat() of each path or None, digest known from the stat
+            manifest for each path or None)
+    """
+    if stat_manifest is None:
+        return [None] * len(paths), [None] * len(paths)
+    stats = [os.stat(pth) for pth in paths]
+    return stats, [stat_manifest.digest(pth, st) for pth, st in zip(paths, stats)]
+
+
+def _collect_paths(paths, func, pool=None):
+    # Results are returned in the order of paths
+    story_list = [None] * len(paths)
+    if paths:
+        # Taken before the workers read the sources: a file changed in
+        # between gets a new stat next time and is hashed again.
+        source_stats, digests = _stat_sources(paths)
+        own_pool = pool is None
+        if own_pool:
+            workers = config.settings.multiprocess
+            pool = _start_pool(min(workers, len(paths)))
+        else:
+            workers = _render_workers()
+        failed = True
+        try:
+            for index, story, stats in pool.imap_unordered(
+                    partial(_collect_one, func), zip(range(len(paths)), paths, digests),
+                    _chunksize(len(paths), workers)):
+                story_list[index] = story
+                if stats is not None:
+                    processor_registry.merge_profile(stats)
+            failed = False
+        finally:
+            if own_pool:
+                close_render_pool(pool, failed)
+        if stat_manifest is not None:
+            for pth, st, story in zip(paths, source_stats, story_list):
+                stat_manifest.record(pth, st, story.source_digest)
+    return story_list
 
 
-def glob_documents(base_path):
+def _collect(base_path, func, pool=None):
+    story_list = _collect_paths(discover_documents(base_path), func, pool)
+    story_list.sort(key=story_sort_key)
+    return story_list
+
+
+def glob_documents(base_path, pool=None):
     """
     Find and parse all story documents (RST and Markdown).
 
     Args:
         base_path: Base directory to search for documents
+        pool: pool from open_render_pool() to parse with, or None to
+            start one
 
     Returns:
         Sorted list of Story objects
     """
-    pool = Pool(config.settings.multiprocess)
+    return _collect(base_path, unmarshal_story, pool)
 
-    # Collect both .rst and .md files
-    rst_files = list(glob('{0}/**/*.rst'.format(base_path), recursive=True))
-    md_files = list(glob('{0}/**/*.md'.format(base_path), recursive=True))
-    all_files = rst_files + md_files
 
-    story_list = pool.map(unmarshal_story, all_files)
-    pool.close()
-    pool.join()
-    story_list.sort()
-    return story_list
+def glob_story_records(base_path, pool=None):
+    """
+    Find and parse all story documents, returning StoryRecord objects.
 
+    Args:
+        base_path: Base directory to search for documents
+        pool: pool from open_render_pool() to parse with, or None to
+            start one
 
-# Backward compatibility alias
-glob_rst_documents = glob_documents
+    Returns:
+        Sorted list of StoryRecord objects
+    """
+    return _collect(base_path, unmarshal_record, pool)
 
 
-def _digest_cache_path(story):
-    return os.path.join(story.directory, '.biisan.raw.sha256')
+def _metadata_scan_available():
+    # The scanner reproduces the built-in header processors only
+    return all(
+        processor_registry.get(name) is getattr(processors, name)
+        for name in ('process_document', 'process_title', 'process_docinfo',
+                     'process_field_name', 'process_field_body'))
 
 
-def _read_digest_cache(cache_path):
-    if not os.path.exists(cache_path):
+def _cached_record(pth, digest):
+    if record_cache is None:
         return None
+    record = record_cache.get(digest)
+    if record is None:
+        return None
+    # A copy, the caller sets the neighbours
+    record = copy.copy(record)
+    record.source_file = pth
+    return record
+
+
+def scan_record(pth, digest=None):
+    """
+    Build a StoryRecord from the story header alone, without parsing the body.
+
+    Args:
+        digest: digest of the source when already known, e.g. from the
+            stat manifest; a record read before is then returned without
+            reading the source
+
+    Returns:
+        StoryRecord, or None when the story needs a full parse
+    """
+    pth = os.fspath(pth)
+    if digest is not None:
+        record = _cached_record(pth, digest)
+        if record is not None:
+            return record
+    with open(pth, 'rb') as f:
+        raw = f.read()
+    known_digest, digest = digest, hashlib.sha256(raw).hexdigest()
+    if digest != known_digest:
+        record = _cached_record(pth, digest)
+        if record is not None:
+            return record
+    story_class = get_klass(config.settings.story_class)
+    _story = story_class()
+    _story.source_file = pth
+    _story.source_digest = digest
     try:
-        with codecs.open(cache_path, 'r', 'utf8') as f:
-            return f.read().strip()
-    except OSError:
+        if pth.endswith('.md'):
+            from biisan.markdown_direct import add_metadata_to_story
+            from biisan.metadata import scan_markdown
+            add_metadata_to_story(scan_markdown(raw.decode('utf8')), _story)
+        else:
+            from biisan.metadata import scan_rst
+            scanned = scan_rst(raw.decode('utf8'))
+            if scanned is None:
+                return None
+            _apply_rst_metadata(scanned, _story)
+    except ValueError as e:
+        logger.debug('Metadata scan failed : {0} {1}'.format(pth, e))
         return None
+    if _story._timestamp is None:
+        return None
+    record = StoryRecord(_story)
+    if record_cache is not None:
+        record_cache.set(digest, record)
+    return record
+
+
+def _apply_rst_metadata(scanned, story):
+    # Same assignments as process_title and process_docinfo
+    title_text, fields = scanned
+    title = Title()
+    title.text = title_text
+    story.title = title
+    for name, value in fields:
+        if name == 'slug':
+            story.slug = value
+        elif name == 'author':
+            story.author = value
+        elif name == 'title':
+            title = Title()
+            title.text = value
+            story.title = title
+        elif name == 'date':
+            story.date = processors._datetime_with_tz(value)
+        else:
+            story.additional_meta[name] = value
+
+
+def scan_story_records(base_path, pool=None):
+    """
+    Find all story documents and read their metadata without parsing
+    bodies. Stories whose header the scanner cannot read are parsed.
+
+    Args:
+        base_path: Base directory to search for documents
+        pool: pool from open_render_pool() to parse with, or None to
+            start one
+
+    Returns:
+        Sorted list of StoryRecord objects
+    """
+    paths = discover_documents(base_path)
+    if not _metadata_scan_available():
+        logger.warning('Custom header processors are registered, parse every story.')
+        records = _collect_paths(paths, unmarshal_record, pool)
+    else:
+        source_stats, digests = _stat_sources(paths)
+        records = [scan_record(pth, digest) for pth, digest in zip(paths, digests)]
+        if stat_manifest is not None:
+            for pth, st, record in zip(paths, source_stats, records):
+                if record is not None:
+                    stat_manifest.record(pth, st, record.source_digest)
+        # Parsed stories are recorded in the stat manifest by _collect_paths
+        missing = [i for i, record in enumerate(records) if record is None]
+        if missing:
+            logger.info('Parse %d stories the metadata scan cannot read', len(missing))
+            parsed = _collect_paths([paths[i] for i in missing], unmarshal_record, pool)
+            for i, record in zip(missing, parsed):
+                records[i] = record
+    records.sort(key=story_sort_key)
+    return records
+
+
+# Backward compatibility alias
+glob_rst_documents = glob_documents
 
 
-def _write_digest_cache(cache_path, digest):
-    with codecs.open(cache_path, 'w', 'utf8') as f:
-        f.write(digest)
+# Older versions kept the digest next to each page in the output directory
+_LEGACY_DIGEST_FILE = '.biisan.raw.sha256'
 
 
-def write_html(story):
-    os.makedirs(story.directory, exist_ok=True)
-    _file = os.path.join(story.directory, 'index.html')
-    cache_path = _digest_cache_path(story)
+def _story_file(story):
+    return os.path.join(story.directory, 'index.html')
+
+
+def _same_file(_file, entry):
+    try:
+        st = os.stat(_file)
+    except FileNotFoundError:
+        return False
+    return st.st_size == entry.size and st.st_mtime_ns == entry.mtime_ns
+
+
+def write_html(story, cached=None):
+    """
+    Args:
+        cached: OutputEntry the output cache holds for the page, or None
+
+    Returns:
+        tuple: (True when the file was written, OutputEntry of the page)
+    """
+    _file = _story_file(story)
     rendered = story.to_html()
     digest = hashlib.sha256(rendered.encode('utf8')).hexdigest()
-    cached_digest = _read_digest_cache(cache_path)
 
-    # Fast path: if rendered content hasn't changed, skip minification and write.
-    if cached_digest == digest and os.path.exists(_file):
-        return False
+    # Fast path: the page renders as last time and the file is the one
+    # written then, so skip minification and the comparison with the file.
+    if cached is not None and cached.digest == digest and _same_file(_file, cached):
+        return False, cached
 
-    _data = html_minify(rendered)
-    _current = None
-    if os.path.exists(_file):
-        with codecs.open(_file, 'r', 'utf8') as f:
-            _current = f.read()
-    if _current == _data:
-        if cached_digest != digest:
-            _write_digest_cache(cache_path, digest)
-        return False
-    with codecs.open(_file, 'w', 'utf8') as f:
-        f.write(_data)
-        logger.info('Write:{0}'.format(_file))
-    _write_digest_cache(cache_path, digest)
-    return True
+    written = write_file(_file, html_minify(rendered))
+    st = os.stat(_file)
+    if cached is None:
+        try:
+            os.remove(os.path.join(story.directory, _LEGACY_DIGEST_FILE))
+        except FileNotFoundError:
+            pass
+    return written, OutputEntry(digest, st.st_size, st.st_mtime_ns)
+
+
+def _story_digests(story_list):
+    return [story.source_digest for story in story_list]
+
+
+def _signature(template_name, *inputs):
+    if build_graph is None:
+        return None
+    return build_graph.signature(template_name, *inputs)
+
+
+def story_signature(graph, story):
+    """
+    Signature of a story page: its template and the component templates,
+    the story source, its neighbours and the extra page name.
+    """
+    return graph.signature(
+        story.template_name,
+        graph.components_digest(),
+        story.source_digest,
+        story.prev_story,
+        story.next_story,
+        story.extra,
+    )
+
+
+def _story_signature(story):
+    if build_graph is None:
+        return None
+    return story_signature(build_graph, story)
+
+
+def _up_to_date(output_file, signature):
+    return signature is not None and build_graph.is_fresh(output_file, signature)
+
+
+def _built(output_file, signature):
+    if signature is not None:
+        build_graph.record(output_file, signature)
+
+
+def _render_workers():
+    workers = config.settings.render_multiprocess
+    if workers is None:
+        workers = config.settings.multiprocess
+    return workers
+
+
+def _chunksize(total, workers):
+    return max(1, total // (workers * 4))
+
+
+def _load_story(record):
+    story = unmarshal_story(record.source_file, record.source_digest)
+    story.prev_story = record.prev_story
+    story.next_story = record.next_story
+    story.extra = record.extra
+    return story
+
+
+def _prepare_body(story):
+    # A fragment set by an earlier build may be from other templates; the
+    # salted cache holds the one matching the current templates.
+    story.body_fragment = None
+    if fragment_cache is None or not story.source_digest:
+        return
+    key = fragment_cache.key_for(story.source_digest)
+    fragment = fragment_cache.get(key)
+    if fragment is None:
+        fragment = story.body_html
+        fragment_cache.set(key, fragment)
+    story.body_fragment = fragment
+
+
+def render_story(story):
+    """
+    Returns:
+        str: the page of a Story or StoryRecord, not minified
+    """
+    if isinstance(story, StoryRecord):
+        story = _load_story(story)
+    _prepare_body(story)
+    return story.to_html()
+
+
+def _render_story(job):
+    # Runs in a pool worker: render, minify and write, report only the result
+    # and the output cache entry, which the parent process stores.
+    story, cached = job
+    if isinstance(story, StoryRecord):
+        story = _load_story(story)
+    _prepare_body(story)
+    written, entry = write_html(story, cached)
+    return _story_file(story), written, entry
+
+
+def _init_worker(settings, parse_cache_, fragment_cache_):
+    """
+    Runs once in every pool worker before its first job. A forked worker
+    has all of this from the build process already; a spawn or forkserver
+    worker starts from a fresh import of this module, with the settings
+    read from BIISAN_SETTINGS_MODULE and no processors registered.
+    Directives are registered on the first reStructuredText file, as in
+    any process.
+    """
+    global parse_cache, fragment_cache
+    config.settings = settings
+    if processor_registry is None:
+        register_processor()
+    parse_cache = parse_cache_
+    fragment_cache = fragment_cache_
+    warm_templates(get_environment(config))
+
+
+def _start_pool(workers):
+    context = multiprocessing.get_context(config.settings.pool_start_method)
+    # Settings changed after loading, e.g. by tests, reach the workers too
+    return context.Pool(workers, _init_worker, (config.settings, parse_cache, fragment_cache))
+
+
+def open_render_pool():
+    """
+    Start the workers parsing and rendering stories, or return None when
+    rendering runs in this process. Call it before starting any thread:
+    forking a process with other threads running can leave locks held in
+    the workers.
+    """
+    workers = _render_workers()
+    if workers <= 1:
+        return None
+    # Load templates before forking so forked workers share them
+    warm_templates(get_environment(config))
+    return _start_pool(workers)
 
 
-def output(story_list):
+def close_render_pool(pool, failed=False):
+    if pool is None:
+        return
+    if failed:
+        pool.terminate()
+    else:
+        pool.close()
+    pool.join()
+
+
+def _output_jobs(stories):
+    # Looked up here, in the build process: workers never open the cache.
+    for story in stories:
+        cached = None if output_cache is None else output_cache.get(_story_file(story))
+        yield story, cached
+
+
+def _render_stories(stories, pool=None, stopped=None):
+    """
+    Args:
+        stopped: threading.Event; once set, no more stories are sent to
+            the workers and the pages already sent are collected
+    """
+    total = len(stories)
+    workers = _render_workers()
+    if workers <= 1 or total <= 1:
+        for job in _output_jobs(stories):
+            yield _render_story(job)
+        return
+    own_pool = pool is None
+    if own_pool:
+        pool = open_render_pool()
+    chunksize = _chunksize(total, workers)
+    # Bound the stories pickled ahead of the workers
+    window = threading.Semaphore(chunksize * workers * 2)
+    if stopped is None:
+        stopped = threading.Event()
+
+    # Look the cache entries up before the pool's feeder thread reads jobs
+    jobs = list(_output_jobs(stories))
+
+    def feed():
+        for job in jobs:
+            window.acquire()
+            if stopped.is_set():
+                return
+            yield job
+
+    failed = True
+    try:
+        for result in pool.imap_unordered(_render_story, feed(), chunksize):
+            window.release()
+            yield result
+        failed = False
+    finally:
+        # Unblock the feeder so the pool can shut down on errors
+        stopped.set()
+        for _ in range(total):
+            window.release()
+        if own_pool:
+            close_render_pool(pool, failed)
+
+
+def _stale_stories(story_list):
+    stale = []
+    for i, story in enumerate(story_list):
+        story.prepare_html(story_list, i)
+        _file = _story_file(story)
+        signature = _story_signature(story)
+        if not _up_to_date(_file, signature):
+            stale.append(story)
+        _built(_file, signature)
+    return stale
+
+
+def output(story_list, kind='story'):
+    _output(story_list, _stale_stories(story_list), kind)
+
+
+def _output(story_list, stale, kind='story', pool=None, stopped=None):
     total = len(story_list)
     if total == 0:
         return
     logger.info('Render start: %d stories', total)
     start = time.monotonic()
+    skipped = total - len(stale)
+    output_writer.up_to_date(kind, skipped)
     written = 0
-    for i, story in enumerate(story_list, start=1):
-        story.prepare_html(story_list, i - 1)
-        if write_html(story):
+    for i, (_file, _written, entry) in enumerate(_render_stories(stale, pool, stopped), start=1):
+        output_writer.record(kind, _written)
+        if output_cache is not None:
+            output_cache.set(_file, entry)
+        if _written:
             written += 1
-        if i == 1 or i % 50 == 0 or i == total:
+        if i == 1 or i % 50 == 0 or i == len(stale):
             elapsed = time.monotonic() - start
             logger.info(
-                'Render progress: %d/%d (written=%d, elapsed=%.1fs)',
-                i, total, written, elapsed
+                'Render progress: %d/%d (written=%d, up-to-date=%d, elapsed=%.1fs)',
+                i + skipped, total, written, skipped, elapsed
             )
+    if output_cache is not None:
+        output_cache.flush()
     logger.info(
-        'Render done: %d/%d written in %.1fs',
-        written, total, time.monotonic() - start
+        'Render done: %d/%d written (%d up-to-date) in %.1fs',
+        written, total, skipped, time.monotonic() - start
     )
 
 
+class _BackgroundOutput(threading.Thread):
+    """
+    Renders story pages while the caller goes on with the index pages.
+    The pages themselves are rendered by the workers of a pool started
+    beforehand; this thread only feeds them and collects the results.
+    """
+
+    def __init__(self, story_list, stale, pool=None):
+        super().__init__(name='biisan-output', daemon=True)
+        self.story_list = story_list
+        self.stale = stale
+        self.pool = pool
+        self.error = None
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            _output(self.story_list, self.stale, pool=self.pool, stopped=self.stopped)
+        except BaseException as e:
+            self.error = e
+
+    def finish(self):
+        if self.ident is not None:
+            self.join()
+        if self.error is not None:
+            raise self.error
+
+    def stop(self):
+        """
+        Stop sending stories to the workers and wait for the pages sent
+        already, e.g. when the build failed meanwhile. Errors of the
+        rendering are logged rather than raised.
+        """
+        self.stopped.set()
+        if self.ident is not None:
+            self.join()
+        if self.error is not None:
+            logger.error('Rendering story pages failed too: %s', self.error)
+
+
+def start_output(story_list, pool=None):
+    """
+    Start rendering story pages. Neighbours and signatures are settled
+    before this returns; with a pool from open_render_pool() the pages are
+    written in the background until finish() is called on the result.
+    """
+    stale = _stale_stories(story_list)
+    rendering = _BackgroundOutput(story_list, stale, pool)
+    if pool is None or len(stale) <= 1:
+        rendering.run()
+    else:
+        rendering.start()
+    return rendering
+
+
 def write_extra(extra):
     extra_page = unmarshal_story('./extra/{0}.rst'.format(extra))
     extra_page.extra = extra
     extra_page.extra_directory(extra)
-    output([extra_page])
+    output([extra_page], 'extra')
     return extra_page
 
 
-def write_top(context):
+def _context_inputs(context):
+    inputs = []
+    for key in sorted(context.keys()):
+        value = context[key]
+        if key == 'config':
+            continue
+        if hasattr(value, 'source_digest'):
+            value = value.source_digest
+        elif isinstance(value, list):
+            value = _story_digests(value)
+        inputs.append((key, value))
+    return inputs
+
+
+def render_top(context):
     env = get_environment(config)
     top = env.get_template('index.html')
-    with codecs.open(
-        os.path.join(
-            config.settings.dir.output, 'index.html'), 'w', 'utf8') as f:
-        f.write(top.render(**context))
+    return top.render(**context)
+
+
+def write_top(context):
+    _file = os.path.join(config.settings.dir.output, 'index.html')
+    signature = _signature('index.html', _context_inputs(context))
+    if _up_to_date(_file, signature):
+        output_writer.up_to_date('top')
+        return
+    output_writer.write('top', _file, render_top(context))
+    _built(_file, signature)
 
 
-def write_blog_top(story_list):
-    latest_story_list = __latest_stories(story_list)
-    year_month = extract_year_month(story_list)
+def render_blog_top(story_index):
+    story_index = _as_index(story_index)
+    latest_story_list = story_index.latest(config.settings.latest_list_count)
     env = get_environment(config)
     blog_top = env.get_template('blog_top.html')
-    with codecs.open(
-        os.path.join(
-            config.settings.dir.output, 'blog', 'index.html'),
-            'w', 'utf8') as f:
-        f.write(blog_top.render(config=config,
-                latest_story_list=latest_story_list,
-                story_list=story_list, year_month=year_month))
+    return blog_top.render(
+        config=config, latest_story_list=latest_story_list,
+        story_list=story_index.stories, year_month=story_index.year_month)
+
+
+def write_blog_top(story_index):
+    story_index = _as_index(story_index)
+    _file = os.path.join(config.settings.dir.output, 'blog', 'index.html')
+    signature = _signature('blog_top.html', story_index.digests)
+    if _up_to_date(_file, signature):
+        output_writer.up_to_date('blog top')
+        return
+    output_writer.write('blog top', _file, render_blog_top(story_index))
+    _built(_file, signature)
+
+
+def _write_jobs(jobs):
+    """
+    Write pages that are independent of each other.
+
+    Archive pages and category feeds are rendered here rather than by the
+    render workers: the templates read a few fields per story, and sending
+    the stories to the workers costs more than rendering the pages. During
+    build() the workers render story pages meanwhile.
+
+    Args:
+        jobs: list of (output file, signature, kind, func, args);
+            func(*args) writes the output file and returns whether it
+            was written
+    """
+    for _file, signature, kind, func, args in jobs:
+        output_writer.record(kind, func(*args))
+        _built(_file, signature)
 
 
-def write_blog_archive(story_list):
-    packed = pack_story_to_year_month(story_list)
+def render_blog_archive(_year_month, stories):
     env = get_environment(config)
     blog_archive = env.get_template('blog_archive.html')
-    for _year_month, stories in packed.items():
-        with codecs.open(
-            os.path.join(
-                config.settings.dir.output, 'blog', _year_month,
-                'index.html'),
-                'w', 'utf8') as f:
-            f.write(blog_archive.render(config=config,
-                    year_month=_year_month, story_list=stories))
-
-
-def write_rss20(story_list):
-    now_rfc2822 = formatdate(float(datetime.now(tz=config.settings.timezone).strftime('%s')))
-    cnt = config.settings.latest_list_count * -1 - 1
-    latest_story_list = story_list[:cnt:-1]
+    return blog_archive.render(
+        config=config, year_month=_year_month, story_list=stories)
+
+
+def _render_blog_archive(_file, _year_month, stories):
+    return write_file(_file, render_blog_archive(_year_month, stories))
+
+
+def _blog_archive_jobs(story_index):
+    jobs = []
+    for _year_month, stories in story_index.by_year_month.items():
+        _file = os.path.join(
+            config.settings.dir.output, 'blog', _year_month, 'index.html')
+        signature = _signature(
+            'blog_archive.html', _year_month, _story_digests(stories))
+        if _up_to_date(_file, signature):
+            output_writer.up_to_date('archive')
+        else:
+            jobs.append((_file, signature, 'archive', _render_blog_archive, (_file, _year_month, stories)))
+    return jobs
+
+
+def write_blog_archive(story_index):
+    _write_jobs(_blog_archive_jobs(_as_index(story_index)))
+
+
+def _feed_build_date(latest_story_list):
+    # The newest story's date rather than the time of the build, so a feed
+    # whose stories did not change renders the same and is not rewritten.
+    if latest_story_list:
+        return latest_story_list[0].publish_date_rfc2822
+    return formatdate(float(datetime.now(tz=config.settings.timezone).strftime('%s')))
+
+
+def render_rss20(latest_story_list):
+    """
+    Args:
+        latest_story_list: stories of the feed, newest first
+    """
+    now_rfc2822 = _feed_build_date(latest_story_list)
     env = get_environment(config)
     rss20 = env.get_template('rss20.xml')
-    rss = rss20.render(config=config,
-                       story_list=latest_story_list,
-                       now_rfc2822=now_rfc2822)
-    feed_dir = os.path.join(config.settings.dir.output, 'api', 'feed')
-    os.makedirs(feed_dir, exist_ok=True)
-    with codecs.open(os.path.join(feed_dir, 'index.xml'), 'w', 'utf8') as f:
-        f.write(rss)
-
-
-def __classify_category(story_list):
-    res = {}
-    for story in story_list:
-        if story.has_additional_meta("category"):
-            category = story.category
-            if category in res:
-                res[category].append(story)
-            else:
-                res[category] = [story]
-    return res
+    return rss20.render(config=config,
+                        story_list=latest_story_list,
+                        now_rfc2822=now_rfc2822)
+
+
+def write_rss20(story_index):
+    latest_story_list = _as_index(story_index).latest(config.settings.latest_list_count)
+    _file = os.path.join(config.settings.dir.output, 'api', 'feed', 'index.xml')
+    signature = _signature('rss20.xml', _story_digests(latest_story_list))
+    if _up_to_date(_file, signature):
+        output_writer.up_to_date('feed')
+        return
+    output_writer.write('feed', _file, render_rss20(latest_story_list))
+    _built(_file, signature)
+
+
+def _render_category_rss20(_file, latest_story_list):
+    return write_file(_file, render_rss20(latest_story_list))
+
+
+def _category_rss20_jobs(story_by_category):
+    jobs = []
+    for category, story_list in story_by_category.items():
+        latest_story_list = latest(story_list, config.settings.latest_list_count)
+        _file = os.path.join(config.settings.dir.output, 'api', 'feed', category, 'index.xml')
+        signature = _signature('rss20.xml', category, _story_digests(latest_story_list))
+        if _up_to_date(_file, signature):
+            output_writer.up_to_date('category feed')
+        else:
+            jobs.append((_file, signature, 'category feed', _render_category_rss20, (_file, latest_story_list)))
+    return jobs
 
 
 def write_category_rss20(category, story_list):
-    now_rfc2822 = formatdate(float(datetime.now(tz=config.settings.timezone).strftime('%s')))
-    cnt = config.settings.latest_list_count * -1 - 1
-    latest_story_list = story_list[:cnt:-1]
-    env = get_environment(config)
-    rss20 = env.get_template('rss20.xml')
-    rss = rss20.render(config=config,
-                       story_list=latest_story_list,
-                       now_rfc2822=now_rfc2822)
-    feed_dir = os.path.join(config.settings.dir.output, 'api', 'feed', category)
-    os.makedirs(feed_dir, exist_ok=True)
-    with codecs.open(os.path.join(feed_dir, 'index.xml'), 'w', 'utf8') as f:
-        f.write(rss)
+    """
+    Args:
+        story_list: stories of the category, oldest first
+    """
+    _write_jobs(_category_rss20_jobs({category: story_list}))
 
 
-def write_sitemaps(story_list):
-    last_modified_iso_8601 = max(map(lambda x: x.date, story_list)).isoformat()
+def render_sitemaps(story_index):
+    story_index = _as_index(story_index)
+    last_modified_iso_8601 = story_index.last_modified.isoformat()
     env = get_environment(config)
     sitemaps = env.get_template('sitemaps.xml')
-    sitemap = sitemaps.render(config=config,
-                              story_list=story_list,
-                              last_modified=last_modified_iso_8601)
-    sitemap_dir = os.path.join(
-        config.settings.dir.output, 'api', 'google_sitemaps')
-    os.makedirs(sitemap_dir, exist_ok=True)
-    with codecs.open(os.path.join(sitemap_dir, 'index.xml'), 'w', 'utf8') as f:
-        f.write(sitemap)
-
-
-def write_all_entry(story_list):
-    last_modified_iso_8601 = max(map(lambda x: x.date, story_list)).isoformat()
+    return sitemaps.render(config=config,
+                           story_list=story_index.stories,
+                           last_modified=last_modified_iso_8601)
+
+
+def write_sitemaps(story_index):
+    story_index = _as_index(story_index)
+    _file = os.path.join(
+        config.settings.dir.output, 'api', 'google_sitemaps', 'index.xml')
+    signature = _signature('sitemaps.xml', story_index.digests)
+    if _up_to_date(_file, signature):
+        output_writer.up_to_date('sitemap')
+        return
+    output_writer.write('sitemap', _file, render_sitemaps(story_index))
+    _built(_file, signature)
+
+
+def render_all_entry(story_index):
+    story_index = _as_index(story_index)
+    last_modified_iso_8601 = story_index.last_modified.isoformat()
     env = get_environment(config)
     all_entry = env.get_template('blog_all.html')
-    all_entries = all_entry.render(config=config,
-                                   story_list=story_list,
-                                   last_modified=last_modified_iso_8601)
-    all_entry_dir = os.path.join(
-        config.settings.dir.output, 'blog', 'all')
-    os.makedirs(all_entry_dir, exist_ok=True)
-    with codecs.open(os.path.join(all_entry_dir, 'index.html'), 'w', 'utf8') as f:
-        f.write(all_entries)
+    return all_entry.render(config=config,
+                            story_list=story_index.stories,
+                            last_modified=last_modified_iso_8601)
+
+
+def write_all_entry(story_index):
+    story_index = _as_index(story_index)
+    _file = os.path.join(
+        config.settings.dir.output, 'blog', 'all', 'index.html')
+    signature = _signature('blog_all.html', story_index.digests)
+    if _up_to_date(_file, signature):
+        output_writer.up_to_date('all entries')
+        return
+    output_writer.write('all entries', _file, render_all_entry(story_index))
+    _built(_file, signature)
 
 
 def register_directives():
+    """
+    Register the directives of config.settings.directives with docutils.
+    Called before the first reStructuredText file of a process is parsed.
+    """
+    global _directives_registered
+    from docutils.parsers.rst import directives
+
     for directive in config.settings.directives:
         directive_class = get_klass(directive)
         directives.register_directive(
@@ -321,6 +972,7 @@ def register_directives():
             directive_class
         )
         logger.debug(directive_class)
+    _directives_registered = True
 
 
 def register_processor():
@@ -329,6 +981,97 @@ def register_processor():
     for processor in config.settings.processors:
         func = get_function(processor)
         processor_registry.register(func.__name__, func)
+    processor_registry.compile()
+    if config.settings.processor_profile:
+        processor_registry.enable_profile()
+
+
+def _parse_cache_salt():
+    overrides = _docutils_settings_overrides()
+    overrides.pop('warning_stream', None)
+    return fingerprint(
+        biisan.__version__,
+        CACHE_FORMAT,
+        config.settings.story_class,
+        config.settings.processors,
+        config.settings.directives,
+        config.settings.directive,
+        config.settings.timezone,
+        config.settings.rst_frontend,
+        config.settings.markdown_frontend,
+        overrides,
+    )
+
+
+def register_parse_cache():
+    global parse_cache
+    if not config.settings.parse_cache:
+        parse_cache = None
+        return
+    parse_cache = DiskCache(
+        os.path.join(os.path.expanduser(config.settings.dir.cache), 'parse'),
+        _parse_cache_salt(),
+    )
+
+
+def register_fragment_cache():
+    global fragment_cache
+    if not config.settings.fragment_cache:
+        fragment_cache = None
+        return
+    # Component templates do not change during a build, so they go into the
+    # salt and a story's fragment is keyed by its source digest alone.
+    fragment_cache = DiskCache(
+        os.path.join(os.path.expanduser(config.settings.dir.cache), 'fragments'),
+        fingerprint(
+            _parse_cache_salt(),
+            config.settings,
+            components_digest(get_environment(config)),
+        ),
+    )
+
+
+def output_cache_path():
+    return os.path.join(os.path.expanduser(config.settings.dir.cache), 'outputs.sqlite3')
+
+
+def register_output_cache():
+    global output_cache
+    if output_cache is not None:
+        output_cache.close()
+    if not config.settings.output_cache:
+        output_cache = None
+        return
+    output_cache = OutputCache(output_cache_path(), config.settings.output_cache_max_entries)
+
+
+def register_stat_manifest():
+    global stat_manifest
+    if not config.settings.stat_manifest:
+        stat_manifest = None
+        return
+    stat_manifest = StatManifest(
+        os.path.join(os.path.expanduser(config.settings.dir.cache), 'sources.json'))
+
+
+def register_record_cache():
+    global record_cache
+    record_cache = RecordCache(
+        os.path.join(os.path.expanduser(config.settings.dir.cache), 'records.pickle'),
+        _parse_cache_salt(),
+    )
+
+
+def register_build_graph():
+    global build_graph
+    if not config.settings.incremental:
+        build_graph = None
+        return
+    build_graph = BuildGraph(
+        os.path.join(os.path.expanduser(config.settings.dir.cache), 'build_graph.json'),
+        get_environment(config),
+        config.settings,
+    )
 
 
 def print_fire_message():
@@ -337,34 +1080,164 @@ def print_fire_message():
 
 
 def prepare():
-    register_directives()
+    global _directives_registered
+    # Registered again, with these settings, on the first RST file
+    _directives_registered = False
     register_processor()
+    register_parse_cache()
+    register_fragment_cache()
+    register_output_cache()
+    register_stat_manifest()
+    register_record_cache()
+    register_build_graph()
+    if config.settings.lightweight_stories and parse_cache is None:
+        # Render workers get records and read the story again; without the
+        # parse cache that is a second full parse of every story page.
+        logger.warning(
+            'lightweight_stories without parse_cache parses every rendered story twice. '
+            'Enable parse_cache or disable lightweight_stories.')
+
+
+def write_indexes(story_index):
+    """
+    Write the pages built from story metadata only: blog top, archives,
+    feeds, sitemaps and the list of all entries.
+
+    Args:
+        story_index: StoryIndex, or a list of stories
+    """
+    story_index = _as_index(story_index)
+    write_blog_top(story_index)
+    write_rss20(story_index)
+    # Only months and categories whose stories changed are written
+    _write_jobs(_blog_archive_jobs(story_index) + _category_rss20_jobs(story_index.by_category))
+    write_sitemaps(story_index)
+    write_all_entry(story_index)
 
 
-def main():
-    logger.info('Collecting stories...')
+def log_output_report():
+    logger.info(
+        'Output: %d written, %d unchanged, %d up-to-date',
+        output_writer.total(OutputWriter.WRITTEN),
+        output_writer.total(OutputWriter.UNCHANGED),
+        output_writer.total(OutputWriter.UP_TO_DATE))
+    for line in output_writer.report():
+        logger.info('  %s', line)
+
+
+def main_indexes():
+    """
+    Rewrite index pages and feeds from a metadata scan, leaving story
+    pages alone.
+    """
     start = time.monotonic()
-    story_list = glob_documents('./blog')
-    if len(story_list) == 0:
+    output_writer.reset()
+    story_index = StoryIndex(scan_story_records('./blog'))
+    if len(story_index) == 0:
         logger.error('NO ENTRY FOUND.')
         return
-    logger.info('Collected %d stories in %.1fs', len(story_list), time.monotonic() - start)
-    output(story_list)
-    context = {}
-    context['config'] = config
-    context['story_list'] = story_list
-    context['latest_story_list'] = __latest_stories(story_list)
-    for extra in config.settings.extra:
-        context[extra] = write_extra(extra)
-    write_top(context)
-    write_blog_top(story_list)
-    write_blog_archive(story_list)
-    write_rss20(story_list)
-    story_by_category = __classify_category(story_list)
-    for category, _story_list in story_by_category.items():
-        write_category_rss20(category, _story_list)
-    write_sitemaps(story_list)
-    write_all_entry(story_list)
+    write_indexes(story_index)
+    save_build_state()
+    log_output_report()
+    logger.info('Wrote indexes for %d stories in %.1fs', len(story_index), time.monotonic() - start)
+
+
+def collect_stories(pool=None):
+    """
+    Args:
+        pool: pool from open_render_pool() to parse with, or None to
+            start one
+
+    Returns:
+        list: Story objects, or StoryRecords with lightweight_stories,
+            of every story under ./blog
+    """
+    if config.settings.lightweight_stories and config.settings.metadata_scan:
+        return scan_story_records('./blog', pool)
+    elif config.settings.lightweight_stories:
+        return glob_story_records('./blog', pool)
+    return glob_documents('./blog', pool)
+
+
+def collect_story(pth):
+    """
+    Collect a single story like collect_stories(), in this process.
+    """
+    if config.settings.lightweight_stories and config.settings.metadata_scan:
+        if _metadata_scan_available():
+            record = scan_record(pth)
+            if record is not None:
+                return record
+    if config.settings.lightweight_stories:
+        return unmarshal_record(pth)
+    return unmarshal_story(pth)
+
+
+def build(story_list, pool=None):
+    """
+    Write every page for the collected stories. Only pages whose inputs
+    changed since the last build are rendered.
+
+    Args:
+        story_list: Story objects or StoryRecords
+        pool: pool from open_render_pool(), or None to render in this
+            process
+    """
+    story_index = StoryIndex(story_list)
+    rendering = start_output(story_index.stories, pool)
+    failed = True
+    try:
+        context = {}
+        context['config'] = config
+        context['story_list'] = story_index.stories
+        context['latest_story_list'] = story_index.latest(config.settings.latest_list_count)
+        for extra in config.settings.extra:
+            context[extra] = write_extra(extra)
+        write_top(context)
+        write_indexes(story_index)
+        failed = False
+    finally:
+        # Also on errors: the caller terminates the workers next, which
+        # would leave the rendering thread waiting for them forever
+        if failed:
+            rendering.stop()
+        else:
+            rendering.finish()
+
+
+def save_build_state():
+    if build_graph is not None:
+        build_graph.save()
+    if stat_manifest is not None:
+        stat_manifest.save()
+    if record_cache is not None:
+        record_cache.save()
+
+
+def main():
+    logger.info('Collecting stories...')
+    start = time.monotonic()
+    output_writer.reset()
+    # One set of workers parses, then renders stories and indexes
+    pool = open_render_pool()
+    failed = True
+    try:
+        story_list = collect_stories(pool)
+        if len(story_list) == 0:
+            logger.error('NO ENTRY FOUND.')
+            failed = False
+            return
+        logger.info('Collected %d stories in %.1fs', len(story_list), time.monotonic() - start)
+        build(story_list, pool)
+        failed = False
+    finally:
+        close_render_pool(pool, failed)
+    save_build_state()
+    log_output_report()
+    if processor_registry.profiling:
+        logger.info('Processor profile:')
+        for line in processor_registry.profile_report():
+            logger.info(line)
 
 
 if __name__ == '__main__':
@@ -10,8 +10,6 @@ from biisan.constants import (
     SETTINGS_TMPL,
 )
 
-import inquirer
-
 
 def check_already_init(data_dir):
     if os.path.exists(data_dir):
@@ -45,6 +43,8 @@ def initialize_structures(data_dir, answer):
 
 
 def init():
+    import inquirer
+
     data_dir = os.path.join(os.getcwd(), BIISAN_DATA_DIR)
     check_already_init(data_dir)
     questions = [
@@ -0,0 +1,345 @@
+"""
+Markdown to biisan.models converter.
+
+Builds the same story objects that parse_markdown_to_xml followed by the
+built-in processors would produce, without the intermediate ElementTree.
+The functions mirror _convert_ast_to_xml and the processors step by step,
+so keep them in sync when either side changes.
+"""
+from marko.ext.gfm import gfm
+from marko import block, inline
+from marko.ext.gfm.elements import Table
+
+from biisan import models
+from biisan.markdown_processor import (
+    _extract_text_from_inline,
+    _metadata_text,
+    extract_yaml_frontmatter,
+)
+from biisan.processors import _datetime_with_tz
+
+
+class _Inline(object):
+    """
+    Stand-in for the ElementTree elements built by _process_inline_children.
+    text and tail are kept as lists of parts (None when unset) and joined
+    once, instead of being grown with +=.
+    """
+
+    __slots__ = ('tag', 'attrs', 'text', 'tail', 'children')
+
+    def __init__(self, tag, attrs=None):
+        self.tag = tag
+        self.attrs = attrs or {}
+        self.text = None
+        self.tail = None
+        self.children = []
+
+    def get_text(self):
+        return None if self.text is None else ''.join(self.text)
+
+    def _collect_text(self, parts):
+        if self.text is not None:
+            parts.extend(self.text)
+        for child in self.children:
+            child._collect_text(parts)
+            if child.tail is not None:
+                parts.extend(child.tail)
+
+    def itertext(self):
+        parts = []
+        self._collect_text(parts)
+        return ''.join(parts)
+
+
+def _append_text(parent, text):
+    # Add text to parent.text or last child's tail
+    if not parent.children:
+        if parent.text is None:
+            parent.text = [text]
+        else:
+            parent.text.append(text)
+    else:
+        last = parent.children[-1]
+        if last.tail is None:
+            last.tail = [text]
+        else:
+            last.tail.append(text)
+
+
+def _build_inline(children, parent):
+    """
+    Same traversal as _process_inline_children, building _Inline nodes.
+    """
+    for child in children:
+        if isinstance(child, inline.RawText):
+            _append_text(parent, child.children)
+
+        elif isinstance(child, inline.Emphasis):
+            elem = _Inline('emphasis')
+            parent.children.append(elem)
+            _build_inline(child.children, elem)
+
+        elif isinstance(child, inline.StrongEmphasis):
+            elem = _Inline('strong')
+            parent.children.append(elem)
+            _build_inline(child.children, elem)
+
+        elif isinstance(child, inline.Link):
+            ref = _Inline('reference', {'refuri': child.dest})
+            ref.text = [_extract_text_from_inline(child.children)]
+            parent.children.append(ref)
+
+        elif isinstance(child, inline.Image):
+            img = _Inline('image', {'uri': child.dest})
+            if child.children:
+                img.attrs['alt'] = _extract_text_from_inline(child.children)
+            parent.children.append(img)
+
+        elif isinstance(child, inline.CodeSpan):
+            literal = _Inline('literal')
+            literal.text = [child.children]
+            parent.children.append(literal)
+
+        elif isinstance(child, inline.LineBreak):
+            if parent.text is None:
+                parent.text = ['\n']
+            else:
+                _append_text(parent, '\n')
+
+        elif isinstance(child, inline.InlineHTML):
+            raw = _Inline('raw', {'format': 'html'})
+            raw.text = [child.children]
+            parent.children.append(raw)
+
+        elif hasattr(child, 'children'):
+            _build_inline(
+                [child.children] if isinstance(child.children, str) else child.children,
+                parent
+            )
+
+
+def _inline_to_model(elem, container):
+    """
+    Create the model the processor registered for elem.tag would create.
+    """
+    if elem.tag == 'strong':
+        content = models.Strong()
+        content.text = elem.itertext()
+    elif elem.tag == 'emphasis':
+        content = models.Emphasis()
+        content.text = elem.itertext()
+    elif elem.tag == 'literal':
+        content = models.Literal()
+        content.text = elem.itertext()
+    elif elem.tag == 'reference':
+        content = models.Reference()
+        text = elem.get_text()
+        content.text = text if text else elem.itertext()
+        content.uri = elem.attrs['refuri']
+    elif elem.tag == 'image':
+        content = models.Image()
+        content.uri = elem.attrs['uri']
+        if 'alt' in elem.attrs:
+            content.alt = elem.attrs['alt']
+    else:
+        content = models.Raw()
+        content.format = elem.attrs['format']
+        content.text = elem.get_text()
+    container.add_content(content)
+
+
+def _add_paragraph(inline_children, container):
+    elem = _Inline('paragraph')
+    _build_inline(inline_children, elem)
+    paragraph = models.Paragraph()
+    paragraph.text = elem.itertext()
+    container.add_content(paragraph)
+    position = len(elem.get_text() or '')
+    for child in elem.children:
+        _inline_to_model(child, paragraph)
+        end = position + len(child.itertext())
+        paragraph.contents[-1].span = (position, end)
+        position = end + len(''.join(child.tail or ()))
+
+
+def _add_section(heading, container, depth=None):
+    section = models.Section()
+    container.add_content(section)
+    if depth:
+        section.depth = depth
+    elem = _Inline('title')
+    _build_inline(heading.children, elem)
+    title = models.Title()
+    title.text = elem.get_text()
+    section.title = title
+    return section
+
+
+def _add_literal_block(node, container):
+    literal_block = models.LiteralBlock()
+    container.add_content(literal_block)
+    literal_block.text = node.children[0].children if node.children else ''
+
+
+def _add_raw_block(node, container):
+    raw = models.Raw()
+    container.add_content(raw)
+    raw.format = 'html'
+    raw.text = node.body
+
+
+def _add_list(node, container):
+    if node.ordered:
+        list_model = models.EnumeratedList()
+    else:
+        list_model = models.BulletList()
+    container.add_content(list_model)
+    for item in node.children:
+        _convert_ast_to_models_nested(item, list_model)
+
+
+def _add_table_row(row_node, container):
+    row = models.Row()
+    if container.__class__ == models.Thead:
+        row.header = True
+    container.add_content(row)
+    for cell_node in row_node.children:
+        entry = models.Entry()
+        row.add_content(entry)
+        if cell_node.children:
+            _add_paragraph(cell_node.children, entry)
+
+
+def _add_table(table_node, container):
+    table = models.Table()
+    container.add_content(table)
+    # process_tgroup adds the tgroup, then hands its children to the table
+    table.add_content(models.Tgroup())
+    for i in range(table_node.num_of_cols):
+        table.add_content(models.ColSpec())
+    if len(table_node.children) > 0:
+        thead = models.Thead()
+        table.add_content(thead)
+        _add_table_row(table_node.children[0], thead)
+        if len(table_node.children) > 1:
+            tbody = models.Tbody()
+            table.add_content(tbody)
+            for row_node in table_node.children[1:]:
+                _add_table_row(row_node, tbody)
+
+
+def _convert_ast_to_models_nested(node, container):
+    """
+    Model counterpart of _convert_ast_to_xml_nested.
+    """
+    if isinstance(node, block.Document):
+        for child in node.children:
+            _convert_ast_to_models_nested(child, container)
+
+    elif isinstance(node, block.Heading):
+        _add_section(node, container)
+
+    elif isinstance(node, block.Paragraph):
+        _add_paragraph(node.children, container)
+
+    elif isinstance(node, block.List):
+        _add_list(node, container)
+
+    elif isinstance(node, block.ListItem):
+        list_item = models.ListItem()
+        container.add_content(list_item)
+        for child in node.children:
+            _convert_ast_to_models_nested(child, list_item)
+
+    elif isinstance(node, block.Quote):
+        block_quote = models.BlockQuote()
+        container.add_content(block_quote)
+        for child in node.children:
+            _convert_ast_to_models_nested(child, block_quote)
+
+    elif isinstance(node, (block.FencedCode, block.CodeBlock)):
+        _add_literal_block(node, container)
+
+    elif isinstance(node, block.ThematicBreak):
+        container.add_content(models.Transition())
+
+    elif isinstance(node, Table):
+        _add_table(node, container)
+
+    elif isinstance(node, block.HTMLBlock):
+        _add_raw_block(node, container)
+
+    elif hasattr(node, 'children') and isinstance(node.children, list):
+        for child in node.children:
+            _convert_ast_to_models_nested(child, container)
+
+
+def _convert_ast_to_models(node, story, current_section_holder):
+    """
+    Model counterpart of _convert_ast_to_xml.
+    """
+    container = current_section_holder[0] if current_section_holder[0] is not None else story
+
+    if isinstance(node, block.Document):
+        for child in node.children:
+            _convert_ast_to_models(child, story, current_section_holder)
+
+    elif isinstance(node, block.Heading):
+        # Sections are flat children of the story, depth from heading level
+        current_section_holder[0] = _add_section(node, story, node.level)
+
+    elif isinstance(node, block.ListItem):
+        _convert_ast_to_models_nested(node, story)
+
+    elif isinstance(node, (block.Paragraph, block.List, block.Quote, block.FencedCode,
+                           block.CodeBlock, block.ThematicBreak, Table, block.HTMLBlock)):
+        _convert_ast_to_models_nested(node, container)
+
+    elif hasattr(node, 'children') and isinstance(node.children, list):
+        for child in node.children:
+            _convert_ast_to_models(child, story, current_section_holder)
+
+
+def add_metadata_to_story(metadata, story):
+    """
+    Apply YAML Front Matter the way process_docinfo applies docinfo fields.
+    """
+    for key, value in metadata.items():
+        value = _metadata_text(value)
+        if key == 'slug':
+            story.slug = value
+        elif key == 'author':
+            story.author = value
+        elif key == 'title':
+            title = models.Title()
+            title.text = value
+            story.title = title
+        elif key == 'date':
+            if value:
+                story.date = _datetime_with_tz(value)
+        elif key == 'comment':
+            # A scalar comment has no fields, so the comment is left empty
+            story.comments.append(models.Comment())
+        else:
+            story.additional_meta[key] = value
+
+
+def parse_markdown_to_story(markdown_text, story):
+    """
+    Parse Markdown text directly into biisan.models objects.
+    Produces the same story as parse_markdown_to_xml followed by the
+    built-in processors, without building an intermediate ElementTree.
+
+    Args:
+        markdown_text: Markdown source text with optional YAML Front Matter
+        story: Story object to fill
+
+    Returns:
+        The given story
+    """
+    metadata, content = extract_yaml_frontmatter(markdown_text)
+    ast = gfm.parse(content)
+    add_metadata_to_story(metadata, story)
+    _convert_ast_to_models(ast, story, [None])
+    return story
@@ -14,6 +14,10 @@ from marko.ext.gfm import gfm
 from marko.ext.gfm.elements import Table, TableRow, TableCell
 
 
+# libyaml's loader when PyYAML was built with it
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
 def extract_yaml_frontmatter(markdown_text):
     """
     Extract YAML Front Matter from Markdown text.
@@ -37,7 +41,7 @@ def extract_yaml_frontmatter(markdown_text):
         yaml_content = match.group(1)
         # print(f"[DEBUG] YAML content: {yaml_content}")
         try:
-            metadata = yaml.safe_load(yaml_content)
+            metadata = yaml.load(yaml_content, Loader=_YAML_LOADER)
             # print(f"[DEBUG] Parsed metadata: {metadata}")
             # Remove front matter from content
             content = markdown_text[match.end():]
@@ -86,6 +90,36 @@ def parse_markdown_to_xml(markdown_text):
     return root
 
 
+def _metadata_text(value):
+    """
+    Convert a YAML Front Matter value to the text of its docinfo field.
+
+    Args:
+        value: Value loaded from YAML Front Matter
+
+    Returns:
+        str: Field text
+    """
+    import datetime
+
+    # Handle different value types
+    if isinstance(value, (list, dict)):
+        # For complex types, convert to string
+        return str(value)
+    elif isinstance(value, datetime.datetime):
+        # Format datetime to string (YYYY-MM-DD HH:MM format)
+        return value.strftime('%Y-%m-%d %H:%M')
+    elif isinstance(value, datetime.date):
+        # Format date to string (YYYY-MM-DD format)
+        return value.strftime('%Y-%m-%d')
+    elif value is None:
+        # Handle None values as empty string
+        return ''
+    else:
+        # For simple types (str, int, etc.)
+        return str(value)
+
+
 def _add_metadata_to_docinfo(metadata, docinfo):
     """
     Convert YAML metadata to docutils docinfo structure.
@@ -94,8 +128,6 @@ def _add_metadata_to_docinfo(metadata, docinfo):
         metadata: Dictionary of metadata from YAML Front Matter
         docinfo: docinfo XML element
     """
-    import datetime
-
     # print(f"[DEBUG] === _add_metadata_to_docinfo START ===")
     # print(f"[DEBUG] Metadata: {metadata}")
     # print(f"[DEBUG] Metadata keys: {list(metadata.keys()) if metadata else 'None'}")
@@ -112,23 +144,7 @@ def _add_metadata_to_docinfo(metadata, docinfo):
         # Create field_body
         field_body = ET.SubElement(field, 'field_body')
         paragraph = ET.SubElement(field_body, 'paragraph')
-
-        # Handle different value types
-        if isinstance(value, (list, dict)):
-            # For complex types, convert to string
-            paragraph.text = str(value)
-        elif isinstance(value, datetime.datetime):
-            # Format datetime to string (YYYY-MM-DD HH:MM format)
-            paragraph.text = value.strftime('%Y-%m-%d %H:%M')
-        elif isinstance(value, datetime.date):
-            # Format date to string (YYYY-MM-DD format)
-            paragraph.text = value.strftime('%Y-%m-%d')
-        elif value is None:
-            # Handle None values as empty string
-            paragraph.text = ''
-        else:
-            # For simple types (str, int, etc.)
-            paragraph.text = str(value)
+        paragraph.text = _metadata_text(value)
 
     # print(f"[DEBUG] === _add_metadata_to_docinfo END ===")
     # print(f"[DEBUG] docinfo now has {len(list(docinfo))} children")
@@ -0,0 +1,174 @@
+"""
+Read story metadata without parsing the story body.
+
+scan_rst reads the document title and docinfo field list at the top of a
+reStructuredText file, scan_markdown reads the YAML Front Matter. Both give
+the values the processors would have put on the story, and scan_rst returns
+None whenever the header uses anything docutils could read differently
+(inline markup, hyperlinks, multi-line values, unusual structure), so the
+caller can fall back to a full parse.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+_ADORNMENT = re.compile(r'^([!-/:-@\[-`{-~])\1*\s*$')
+_FIELD = re.compile(r'^:(?![: ])((?:[^:\\]|\\.)+?)(?<! ):(?:\s+(.*?))?\s*$')
+_COMMENT = re.compile(r'^\.\.(?:\s|$)')
+_ESCAPE = re.compile(r'\\(.)', re.DOTALL)
+_ESCAPED_WHITESPACE = re.compile(r'\\\s')
+_INLINE_MARKUP = re.compile(
+    r'[*`|\[\]$@<>]'                 # emphasis, literals, roles, substitutions, footnotes
+    r'|_(?![\w_])'                   # hyperlink references: word_ and word__
+    r'|[A-Za-z][A-Za-z0-9+.-]*:'     # standalone URIs (scheme:)
+)
+_LIST_MARKER = re.compile(r'^(?:[-+*#>|:.]|\(?\w+[.)](?:\s|$))')
+
+
+@lru_cache(maxsize=None)
+def _bibliographic_fields():
+    # Docinfo fields docutils turns into their own elements. Only author and
+    # date are read by process_docinfo, the others never reach the story.
+    from docutils.languages import en
+    return frozenset(en.bibliographic_fields)
+
+
+def _column_width(text):
+    return sum(2 if unicodedata.east_asian_width(c) in 'WF' else 1 for c in text)
+
+
+def _plain_text(value):
+    """
+    Text of a paragraph without inline markup, or None when the value could
+    contain markup, a hyperlink or block structure.
+    """
+    if not value or value.endswith('\\'):
+        return None
+    if _INLINE_MARKUP.search(_ESCAPE.sub('x', value)) or _LIST_MARKER.match(value):
+        return None
+    return _ESCAPE.sub(r'\1', _ESCAPED_WHITESPACE.sub('', value))
+
+
+def _is_adornment(line):
+    return len(line) >= 4 and _ADORNMENT.match(line) is not None
+
+
+def _read_title(lines, index):
+    """
+    Returns:
+        tuple: (title, adornment, next index), or None when lines[index]
+        does not start a section title
+    """
+    overline = None
+    if _is_adornment(lines[index]):
+        overline = lines[index].rstrip()
+        index += 1
+        if index + 1 >= len(lines):
+            return None
+        text = lines[index].strip()
+        underline = lines[index + 1].rstrip()
+        if underline != overline:
+            return None
+    else:
+        if index + 1 >= len(lines) or lines[index][:1].isspace():
+            return None
+        text = lines[index].rstrip()
+        underline = lines[index + 1].rstrip()
+        if not _is_adornment(underline):
+            return None
+    if not text or len(underline) < _column_width(text):
+        return None
+    return text, (overline is not None, underline[0]), index + 2
+
+
+def _has_other_section(lines, index, adornment):
+    # The document title is only promoted when its section is the only one
+    # at the top level, so look for another title with the same adornment.
+    with_overline, char = adornment
+    rest = '\n'.join(lines[index:])
+    pattern = re.compile(r'^{0}{{4,}}[ \t]*$'.format(re.escape(char)), re.MULTILINE)
+    for match in pattern.finditer(rest):
+        i = index + rest.count('\n', 0, match.start()) - 1
+        if i < index:
+            continue
+        line = lines[i]
+        if not line.strip() or line[:1].isspace() or _is_adornment(line):
+            continue
+        if with_overline == (i > 0 and lines[i - 1].rstrip() == lines[i + 1].rstrip()):
+            return True
+    return False
+
+
+def scan_rst(text):
+    """
+    Read the title and docinfo of a reStructuredText story.
+
+    Args:
+        text: reStructuredText source
+
+    Returns:
+        tuple: (title, fields) where fields is a list of (name, value) in
+        document order, with bibliographic names lowercased. None when the
+        header cannot be read safely without docutils.
+    """
+    lines = text.splitlines()
+    index = 0
+    while index < len(lines) and (not lines[index].strip() or _COMMENT.match(lines[index])):
+        if _COMMENT.match(lines[index]):
+            return None
+        index += 1
+    if index >= len(lines):
+        return None
+    found = _read_title(lines, index)
+    if found is None:
+        return None
+    title, adornment, index = found
+    title = _plain_text(title)
+    if title is None or _has_other_section(lines, index, adornment):
+        return None
+
+    fields = []
+    while index < len(lines):
+        line = lines[index]
+        if not line.strip():
+            index += 1
+            continue
+        match = _FIELD.match(line)
+        if match is None:
+            break
+        name, value = match.group(1), match.group(2)
+        index += 1
+        body = []
+        while index < len(lines) and (not lines[index].strip() or lines[index][:1].isspace()):
+            if lines[index].strip():
+                body.append(lines[index])
+            index += 1
+        normed = ' '.join(name.lower().split())
+        if normed == 'comment':
+            # comments are kept on the full story only
+            continue
+        if body or _plain_text(name) != name:
+            return None
+        if normed in _bibliographic_fields():
+            name = normed
+            if name not in ('author', 'date'):
+                continue
+        value = _plain_text(value) if name != 'date' else value
+        if value is None:
+            return None
+        fields.append((name, value))
+    if not fields:
+        return None
+    return title, fields
+
+
+def scan_markdown(text):
+    """
+    Read the YAML Front Matter of a Markdown story.
+
+    Returns:
+        dict: metadata, as parse_markdown_to_xml reads it
+    """
+    from biisan.markdown_processor import extract_yaml_frontmatter
+    metadata, _ = extract_yaml_frontmatter(text)
+    return metadata
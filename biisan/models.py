@@ -5,68 +5,89 @@ from hashlib import md5
 
 from glueplate import config
 
+from biisan.renderers import get_renderer
 from biisan.utils import get_environment
 
 
 logger = logging.getLogger(__name__)
 
 
+# Document nodes declare __slots__ so a parsed story costs no per node
+# __dict__. The mixins have empty slots, and each node class lists the
+# attributes it and its mixins set (_body for Container, depth for
+# Nestable). Story and Comment still have a __dict__.
+
+
 class Container(object):
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.__body = []
-
-    def __append_to_body(self, content):
-        pass
+        # the list is created on first use, so empty leaves cost no list
+        self._body = None
 
     def add_content(self, content):
         # if issubclass(content.__class__, Document):
-        #     content.cnt = len(self.__body) + 1
-        if issubclass(self.__class__, Nestable) and (type(self) == type(content)):
+        #     content.cnt = len(self._body) + 1
+        if isinstance(self, Nestable) and (type(self) == type(content)):
             content.depth = self.depth + 1
-        self.__append_to_body(content)
-        self.__body.append(content)
+        if self._body is None:
+            self._body = [content]
+        else:
+            self._body.append(content)
 
     @property
     def contents(self):
-        return self.__body
+        if self._body is None:
+            # store it, callers may append to the list they get back
+            self._body = []
+        return self._body
 
 
 class Nestable(object):
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.depth = kwargs.get('depth', 1)
 
 
+class _LazyEnvironment(object):
+    # Creates the Jinja environment on first use instead of at import,
+    # then replaces itself with it
+    def __get__(self, instance, owner):
+        HTMLize.env = get_environment(config)
+        return HTMLize.env
+
+
 class HTMLize(object):
-    env = get_environment(config)
+    __slots__ = ()
+    env = _LazyEnvironment()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def to_html(self):
-        tmpl = HTMLize.env.get_template(
-            os.path.join(
-                'components',
-                '{0}.html'.format(self.__class__.__name__).lower()
-            )
+    @property
+    def template_name(self):
+        return os.path.join(
+            'components',
+            '{0}.html'.format(self.__class__.__name__).lower()
         )
+
+    def to_html(self):
+        if config.settings.native_renderers:
+            renderer = get_renderer(HTMLize.env, self.template_name)
+            if renderer is not None:
+                return renderer(self)
+        tmpl = HTMLize.env.get_template(self.template_name)
         return tmpl.render(element=self, config=config, hash_func=md5)
 
 
-class Story(Container, HTMLize):
-    def __init__(self):
-        super().__init__()
-        self.slug = ''
-        self.title = ''
-        self.__date = None
-        self.author = ''
-        self.__body = []
-        self.comments = []
-        self._timestamp = None
-        self.source_file = ''
-        self.extra = None
-        self.additional_meta = {}
+class StoryMeta(object):
+    """
+    Accessors derived from a story's docinfo, shared by Story and the
+    lightweight StoryRecord.
+    """
 
     def __lt__(self, other):
         try:
@@ -75,14 +96,9 @@ class Story(Container, HTMLize):
             logger.error('-' * 20)
             logger.error(self.source_file)
             logger.error(self.slug)
-            logger.error(self.__body)
             logger.error('=' * 20)
             raise e
 
-    def __repr__(self):
-        return '{0}: {1} at {2}, {3} comments'.format(
-            self.slug, self.title, self.__date, len(self.comments))
-
     def __getattr__(self, name):
         try:
             return object.__getattribute__(self, 'additional_meta')[name]
@@ -92,26 +108,15 @@ class Story(Container, HTMLize):
     def has_additional_meta(self, name):
         return hasattr(self, name)
 
-    @property
-    def date(self):
-        if self.__date is None:
-            raise ValueError('date must not be None.')
-        return self.__date
-
-    @date.setter
-    def date(self, date):
-        self.__date = date
-        self._timestamp = self.__date.timestamp()
-
     @property
     def directory(self):
         if not hasattr(self, '_directory'):
             self._directory = os.path.join(
                 '{0}'.format(config.settings.dir.output),
                 'blog',
-                '{0:04d}'.format(self.__date.year),
-                '{0:02d}'.format(self.__date.month),
-                '{0:02d}'.format(self.__date.day),
+                '{0:04d}'.format(self.date.year),
+                '{0:02d}'.format(self.date.month),
+                '{0:02d}'.format(self.date.day),
                 self.slug
             )
         return self._directory
@@ -121,42 +126,42 @@ class Story(Container, HTMLize):
         return os.path.join(
             '{0}'.format(config.settings.dir.output),
             'archive',
-            '{0:04d}'.format(self.__date.year),
-            '{0}'.format(self.__date.month)
+            '{0:04d}'.format(self.date.year),
+            '{0}'.format(self.date.month)
         )
 
     @property
     def url(self):
         return '/blog/{0:04d}/{1:02d}/{2:02d}/{3}/{4}'.format(
-            self.__date.year,
-            self.__date.month,
-            self.__date.day,
+            self.date.year,
+            self.date.month,
+            self.date.day,
             self.slug,
             '')
 
     @property
     def publishd_date(self):
         return '{0:04d}-{1:02d}-{2:02d}/'.format(
-            self.__date.year,
-            self.__date.month,
-            self.__date.day)
+            self.date.year,
+            self.date.month,
+            self.date.day)
 
     @property
     def published_datetime(self):
         return '{0:04d}/{1:02d}/{2:02d} {3:02d}:{4:02d}'.format(
-            self.__date.year,
-            self.__date.month,
-            self.__date.day,
-            self.__date.hour,
-            self.__date.minute)
+            self.date.year,
+            self.date.month,
+            self.date.day,
+            self.date.hour,
+            self.date.minute)
 
     @property
     def publish_date_rfc2822(self):
-        return formatdate(float(self.__date.strftime('%s')))
+        return formatdate(float(self.date.strftime('%s')))
 
     @property
     def publish_datetime_iso_8601(self):
-        return self.__date.isoformat()
+        return self.date.isoformat()
 
     def prepare_html(self, story_list, i):
         self.prev_story = previous_story(story_list, i)
@@ -168,6 +173,72 @@ class Story(Container, HTMLize):
             directory)
 
 
+class Story(Container, StoryMeta, HTMLize):
+    def __init__(self):
+        super().__init__()
+        self.slug = ''
+        self.title = ''
+        self.__date = None
+        self.author = ''
+        self.comments = []
+        self._timestamp = None
+        self.source_file = ''
+        self.source_digest = ''
+        self.extra = None
+        self.additional_meta = {}
+        self.body_fragment = None
+
+    def __repr__(self):
+        return '{0}: {1} at {2}, {3} comments'.format(
+            self.slug, self.title, self.__date, len(self.comments))
+
+    @property
+    def date(self):
+        if self.__date is None:
+            raise ValueError('date must not be None.')
+        return self.__date
+
+    @date.setter
+    def date(self, date):
+        self.__date = date
+        self._timestamp = self.__date.timestamp()
+
+    @property
+    def body_html(self):
+        """
+        The rendered contents, the part of story.html that does not depend
+        on the page layout. body_fragment holds it when it comes from the
+        fragment cache; a rendered body is not kept on the story, which
+        may outlive the templates it was rendered with.
+        """
+        if getattr(self, 'body_fragment', None) is not None:
+            return self.body_fragment
+        return ''.join(
+            '\n{0}\n'.format(content.to_html()) for content in self.contents)
+
+
+class StoryRecord(StoryMeta):
+    """
+    The part of a Story needed for index pages, feeds and prev/next links.
+    Pool workers return these instead of the whole document tree.
+    """
+
+    def __init__(self, story):
+        self.slug = story.slug
+        self.title = str(story.title)
+        self.date = story.date
+        self.author = story.author
+        self._timestamp = story._timestamp
+        self.source_file = story.source_file
+        self.source_digest = story.source_digest
+        self.template_name = story.template_name
+        self.extra = story.extra
+        self.additional_meta = dict(story.additional_meta)
+
+    def __repr__(self):
+        return '{0}: {1} at {2}'.format(self.slug, self.title, self.date)
+
+
 def archive_directory(year_month):
     return os.path.join(
         '{0}'.format(config.settings.dir.output),
@@ -213,55 +284,85 @@ def previous_story(story_list, i):
 
 
 class Document():
+    # span: (start, end) of an inline element in its paragraph's text
+    __slots__ = ('span',)
+    cnt = 0
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.cnt = 0
+
+
+def _inline_html(content):
+    if isinstance(content, Strong):
+        return '<strong>{0}</strong>'.format(content.text)
+    elif isinstance(content, Emphasis):
+        return '<i>{0}</i>'.format(content.text)
+    elif isinstance(content, Literal):
+        return '<code>{0}</code>'.format(content.text)
+    elif isinstance(content, Reference):
+        _name = content.name and content.name or content.text
+        return '<a href="{0}">{1}</a>'.format(content.uri, _name)
+    elif content.format == 'html':
+        # HTML format: output as-is without wrapping
+        return content.text
+    else:
+        # Other formats: wrap in pre tag
+        return '<pre class="code {0}">{1}</pre>'.format(
+            content.format, content.text)
 
 
 class Paragraph(Document, Container, HTMLize):
+    __slots__ = ('_body', 'text', '_formated')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.text = ''
 
-    @property
-    def formated(self):
-        # For inline elements that need text replacement
+    def _inline_contents(self):
+        return [
+            content for content in self.contents
+            if isinstance(content, (Strong, Emphasis, Literal, Reference, Raw)) and content.text
+        ]
+
+    def _format_by_span(self):
+        # Single pass over the text using the (start, end) span each inline
+        # element got at parse time. None when a span is missing or does not
+        # match, e.g. a story cached by an older biisan or a custom processor.
+        parts = []
+        position = 0
+        for content in self._inline_contents():
+            span = getattr(content, 'span', None)
+            if span is None:
+                return None
+            start, end = span
+            if start < position or self.text[start:end] != content.text:
+                return None
+            parts.append(self.text[position:start])
+            parts.append(_inline_html(content))
+            position = end
+        parts.append(self.text[position:])
+        return ''.join(parts)
+
+    def _format_by_replace(self):
         _formated = self.text
+        for content in self._inline_contents():
+            _formated = _formated.replace(content.text, _inline_html(content))
+        return _formated
 
-        # First pass: replace text-based inline elements
-        for content in self.contents:
-            if isinstance(content, Strong):
-                _formated = _formated.replace(
-                    content.text, '<strong>{0}</strong>'.format(
-                        content.text))
-            elif isinstance(content, Emphasis):
-                _formated = _formated.replace(
-                    content.text, '<i>{0}</i>'.format(
-                        content.text))
-            elif isinstance(content, Literal):
-                _formated = _formated.replace(
-                    content.text, '<code>{0}</code>'.format(
-                        content.text))
-            elif isinstance(content, Reference):
-                _name = content.name and content.name or content.text
-                if content.text:  # Only replace if text exists
-                    _formated = _formated.replace(
-                        content.text,
-                        '<a href="{0}">{1}</a>'.format(
-                            content.uri, _name))
-            elif isinstance(content, Raw):
-                if content.format == 'html':
-                    # HTML format: output as-is without wrapping
-                    _formated = _formated.replace(
-                        content.text, content.text)
-                else:
-                    # Other formats: wrap in pre tag
-                    _formated = _formated.replace(
-                        content.text,
-                        '<pre class="code {0}">{1}</pre>'.format(
-                            content.format, content.text))
-
-        # Second pass: append non-text elements (like images)
+    @property
+    def formated(self):
+        # Templates may read this more than once, so keep the last result
+        # while text and contents are unchanged.
+        key = (self.text, len(self.contents))
+        cached = getattr(self, '_formated', None)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        _formated = self._format_by_span()
+        if _formated is None:
+            _formated = self._format_by_replace()
+
+        # Append non-text elements (like images)
         for content in self.contents:
             if isinstance(content, Image):
                 # Image doesn't have text to replace, so we append it
@@ -271,43 +372,58 @@ class Paragraph(Document, Container, HTMLize):
                     "Type:{0} in paragraph doesn't treat.".format(
                         type(content)))
 
+        self._formated = (key, _formated)
         return _formated
 
 
 class Strong(Document, HTMLize):
+    __slots__ = ('text',)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.text = ''
 
 
 class Emphasis(Document, HTMLize):
+    __slots__ = ('text',)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.text = ''
 
 
 class Section(Document, Container, Nestable, HTMLize):
+    __slots__ = ('_body', 'depth', 'title')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.title = ''
 
 
 class BulletList(Document, Container, Nestable, HTMLize):
+    __slots__ = ('_body', 'depth')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
 
 class EnumeratedList(Document, Container, Nestable, HTMLize):
+    __slots__ = ('_body', 'depth')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
 
 class ListItem(Document, Container, Nestable, HTMLize):
+    __slots__ = ('_body', 'depth')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
 
 class Title(Document):
+    __slots__ = ('text',)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.text = ''
@@ -317,6 +433,8 @@ class Title(Document):
 
 
 class Target(Document, HTMLize):
+    __slots__ = ('ids', 'names', 'uri')
+
     def __init__(self):
         super().__init__()
         self.ids = ''
@@ -325,6 +443,8 @@ class Target(Document, HTMLize):
 
 
 class Reference(Document, HTMLize):
+    __slots__ = ('name', 'uri', 'text')
+
     def __init__(self):
         super().__init__()
         self.name = ''
@@ -333,12 +453,16 @@ class Reference(Document, HTMLize):
 
 
 class Literal(Document, HTMLize):
+    __slots__ = ('text',)
+
     def __init__(self):
         super().__init__()
         self.text = ''
 
 
 class Raw(Document, HTMLize):
+    __slots__ = ('format', 'text')
+
     def __init__(self):
         super().__init__()
         self.format = ''
@@ -346,6 +470,8 @@ class Raw(Document, HTMLize):
 
 
 class Image(Document, HTMLize):
+    __slots__ = ('alt', 'uri', '_width', '_height')
+
     def __init__(self):
         super().__init__()
         self.alt = ''
@@ -375,49 +501,67 @@ class Image(Document, HTMLize):
 
 
 class BlockQuote(Document, Container, Nestable, HTMLize):
+    __slots__ = ('_body', 'depth')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
 
 class LiteralBlock(Document, Container, Nestable, HTMLize):
+    __slots__ = ('_body', 'depth', 'text')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.text = kwargs.get('text', '')
 
 
 class Figure(Document, Container, HTMLize):
+    __slots__ = ('_body',)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
 
 class Caption(Document, HTMLize):
+    __slots__ = ('text',)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.text = ''
 
 
 class Table(Document, Container, HTMLize):
+    __slots__ = ('_body', 'title')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.title = Title()
 
 
 class Thead(Document, Container, HTMLize):
+    __slots__ = ('_body',)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
 
 class Tbody(Document, Container, HTMLize):
+    __slots__ = ('_body',)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
 
 class Tgroup(Document, Container, HTMLize):
+    __slots__ = ('_body',)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
 
 class ColSpec(Document, HTMLize):
+    __slots__ = ('colname', 'width', 'scale')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.colname = ''
@@ -426,66 +570,84 @@ class ColSpec(Document, HTMLize):
 
 
 class Row(Document, Container, HTMLize):
+    __slots__ = ('_body', 'header')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.header = False
 
-    def to_html(self):
+    @property
+    def template_name(self):
         if not self.header:
-            return super().to_html()
-        tmpl = HTMLize.env.get_template(
-            os.path.join(
-                'components',
-                'header_{0}.html'.format(self.__class__.__name__).lower()
-            )
+            return super().template_name
+        return os.path.join(
+            'components',
+            'header_{0}.html'.format(self.__class__.__name__).lower()
         )
-        return tmpl.render(element=self, config=config, hash_func=md5)
 
 
 class Entry(Document, Container, HTMLize):
+    __slots__ = ('_body',)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
 
 class Transition(Document, HTMLize):
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
 
 class Topic(Document, Container, HTMLize):
+    __slots__ = ('_body', 'title')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.title = Title()
 
 
 class SubstitutionDefinition(Document, Container, HTMLize):
+    __slots__ = ('_body', 'title')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.title = Title()
 
 
 class Note(Document, Container, HTMLize):
+    __slots__ = ('_body',)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
 
 class DefinitionList(Document, Container, Nestable, HTMLize):
+    __slots__ = ('_body', 'depth')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
 
 class Term(Document):
+    __slots__ = ('text',)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.text = kwargs.get('text', '')
 
 
 class Definition(Document, Container):
+    __slots__ = ('_body',)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
 
 class DefinitionListItem(Document, HTMLize):
+    __slots__ = ('term', 'definition')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.term = Term()
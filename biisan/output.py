@@ -0,0 +1,120 @@
+"""
+Writing generated files.
+
+Every page, feed and sitemap goes through write_file, which leaves a file
+alone when its content is unchanged, so mtimes only move for files that
+really changed, and replaces changed files atomically. OutputWriter counts
+what happened to each kind of output during a build.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+
+def _same_content(path, data):
+    try:
+        if os.stat(path).st_size != len(data):
+            return False
+        with open(path, 'rb') as f:
+            return f.read() == data
+    except FileNotFoundError:
+        return False
+
+
+def write_file(path, data):
+    """
+    Write data to path unless the file already holds exactly that.
+    The file is written next to path under a temporary name and renamed,
+    so readers never see a partial file.
+
+    Args:
+        path: output file
+        data: str (written as UTF-8) or bytes
+
+    Returns:
+        bool: True when the file was written
+    """
+    if isinstance(data, str):
+        data = data.encode('utf8')
+    if _same_content(path, data):
+        return False
+    directory, name = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, '.{0}.{1}.tmp'.format(name, os.getpid()))
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    logger.info('Write:{0}'.format(path))
+    return True
+
+
+class OutputWriter(object):
+    """
+    Counts written, unchanged and up-to-date (not rendered at all) files
+    per kind of output. Safe to use from the render thread and the main
+    thread at the same time.
+    """
+
+    WRITTEN = 'written'
+    UNCHANGED = 'unchanged'
+    UP_TO_DATE = 'up-to-date'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = OrderedDict()
+
+    def _add(self, kind, state, count=1):
+        with self._lock:
+            counts = self.counts.setdefault(
+                kind, {self.WRITTEN: 0, self.UNCHANGED: 0, self.UP_TO_DATE: 0})
+            counts[state] += count
+
+    def write(self, kind, path, data):
+        """
+        Returns:
+            bool: True when the file was written
+        """
+        written = write_file(path, data)
+        self.record(kind, written)
+        return written
+
+    def record(self, kind, written):
+        """
+        Count a file written (or left unchanged) elsewhere, e.g. by a pool
+        worker.
+        """
+        self._add(kind, self.WRITTEN if written else self.UNCHANGED)
+
+    def up_to_date(self, kind, count=1):
+        self._add(kind, self.UP_TO_DATE, count)
+
+    def total(self, state):
+        with self._lock:
+            return sum(x[state] for x in self.counts.values())
+
+    def report(self):
+        """
+        Returns:
+            list: one line per kind of output
+        """
+        with self._lock:
+            return [
+                '{0}: written={1}, unchanged={2}, up-to-date={3}'.format(
+                    kind, x[self.WRITTEN], x[self.UNCHANGED], x[self.UP_TO_DATE])
+                for kind, x in self.counts.items()
+            ]
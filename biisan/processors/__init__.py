@@ -1,5 +1,6 @@
 from datetime import datetime
 import logging
+import time
 
 from glueplate import config
 
@@ -282,9 +283,16 @@ def process_paragraph(elm, registry, container):
     # Get all text for text-based element replacement
     paragraph.text = ''.join(elm.itertext())
     container.add_content(paragraph)
-    # Process all child elements (including images)
+    # Process all child elements (including images), recording where each
+    # inline element's text lies in paragraph.text for Paragraph.formated
+    position = len(elm.text or '')
     for _elm in list(elm):
+        count = len(paragraph.contents)
         registry.process(_elm, paragraph)
+        end = position + len(''.join(_elm.itertext()))
+        if len(paragraph.contents) == count + 1:
+            paragraph.contents[-1].span = (position, end)
+        position = end + len(_elm.tail or '')
 
 
 def process_strong(elm, registry, container):
@@ -416,14 +424,33 @@ def process_docinfo(elm, registry, story):
     # print(f"[DEBUG] Final story._Story__date: {story._Story__date}")
 
 
+PROCESSOR_PREFIX = 'process_'
+
+
 class FunctionRegistry(dict):
+    """
+    Processors keyed by name. ``process`` dispatches an element to
+    ``process_<tag>`` through a tag table compiled from the registered
+    processors, rebuilt whenever a processor is registered.
+    """
+
     def __init__(self, *args, **kwargs):
+        object.__setattr__(self, '_dispatch', None)
+        object.__setattr__(self, '_stats', None)
         for key, value in kwargs.items():
             if hasattr(value, '__call__'):
                 self[key] = value
             else:
                 raise ValueError('accept only callable.')
 
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        object.__setattr__(self, '_dispatch', None)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        object.__setattr__(self, '_dispatch', None)
+
     def __setattr__(self, key, value):
         if hasattr(value, '__call__'):
             self[key] = value
@@ -442,15 +469,73 @@ class FunctionRegistry(dict):
     def register(self, name, func):
         setattr(self, name, func)
 
+    def compile(self):
+        """
+        Build the tag -> processor table used by ``process``.
+        """
+        dispatch = {
+            name[len(PROCESSOR_PREFIX):]: func
+            for name, func in self.items()
+            if name.startswith(PROCESSOR_PREFIX)
+        }
+        object.__setattr__(self, '_dispatch', dispatch)
+        return dispatch
+
+    @property
+    def profiling(self):
+        return self._stats is not None
+
+    def enable_profile(self):
+        """
+        Count calls and time spent per tag. Times include the nested
+        elements a processor hands back to the registry.
+        """
+        object.__setattr__(self, '_stats', {})
+
+    def reset_profile(self):
+        if self._stats is not None:
+            self._stats.clear()
+
+    def profile_stats(self):
+        return {tag: list(stat) for tag, stat in (self._stats or {}).items()}
+
+    def merge_profile(self, stats):
+        for tag, (count, seconds) in stats.items():
+            stat = self._stats.setdefault(tag, [0, 0.0])
+            stat[0] += count
+            stat[1] += seconds
+
+    def profile_report(self):
+        return [
+            '{0:<28} {1:>8} calls {2:>9.3f}s'.format(tag, count, seconds)
+            for tag, (count, seconds) in sorted(
+                self.profile_stats().items(), key=lambda x: x[1][1], reverse=True)
+        ]
+
+    def _process_profiled(self, fnc, elm, container):
+        stat = self._stats.setdefault(elm.tag, [0, 0.0])
+        start = time.perf_counter()
+        try:
+            return fnc(elm, self, container)
+        finally:
+            stat[0] += 1
+            stat[1] += time.perf_counter() - start
+
     def process(self, elm, container):
-        _processor_name = 'process_{0}'.format(elm.tag)
-        if hasattr(self, _processor_name):
+        dispatch = self._dispatch
+        if dispatch is None:
+            dispatch = self.compile()
+        _fnc = dispatch.get(elm.tag)
+        if _fnc is None:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    'processor {0}{1} is not defined and element ignored.'.format(
+                        PROCESSOR_PREFIX, elm.tag))
+            return None
+        if self._stats is not None:
+            return self._process_profiled(_fnc, elm, container)
+        if logger.isEnabledFor(logging.DEBUG):
             logger.debug('---------------')
-            logger.debug(getattr(self, _processor_name).__name__)
-            logger.debug(getattr(self, _processor_name).__code__.co_varnames)
-            _fnc = getattr(self, _processor_name)
-            return _fnc(elm, self, container)
-        else:
-            logger.debug(
-                'processor {0} is not defined and element ignored.'.format(
-                    _processor_name))
+            logger.debug(_fnc.__name__)
+            logger.debug(_fnc.__code__.co_varnames)
+        return _fnc(elm, self, container)
@@ -0,0 +1,188 @@
+"""
+Python renderers for the built-in component templates.
+
+Each renderer returns exactly what the matching template under
+``biisan/templates/components`` renders, without the per node cost of a
+Jinja template call. A renderer is only used while the built-in template is
+the one the environment would load; as soon as a directory in
+``template_dirs`` overrides the component, the template is rendered instead.
+"""
+import os
+
+from jinja2 import FileSystemLoader
+
+import biisan
+
+
+BUILTIN_TEMPLATE_DIR = os.path.realpath(
+    os.path.join(os.path.dirname(biisan.__file__), 'templates'))
+
+
+def _each(element, fmt):
+    return ''.join(fmt.format(content.to_html()) for content in element.contents)
+
+
+def render_strong(element):
+    return '<strong>{0}</strong>'.format(element.text)
+
+
+def render_emphasis(element):
+    return '<italic>{0}</italic>'.format(element.text)
+
+
+def render_literal(element):
+    return '<code>{0}</code>'.format(element.text)
+
+
+def render_literal_block(element):
+    return '<pre><code>{0}</code></pre>'.format(element.text)
+
+
+def render_raw(element):
+    return '{0}'.format(element.text)
+
+
+def render_reference(element):
+    return '<a href="#{0}">{1}</a>'.format(element.name, element.text)
+
+
+def render_target(element):
+    return '<!-- <a id="#{0}" name="{1}" href="{2}">{1}</a> -->'.format(
+        element.ids, element.names, element.uri)
+
+
+def render_transition(element):
+    return '<hr />'
+
+
+def render_caption(element):
+    return '<p class="caption">{0}</p>'.format(element.text)
+
+
+def render_paragraph(element):
+    return '<p class="m-2">{0}</p>'.format(element.formated)
+
+
+def render_image(element):
+    html = '<img src="{0}" alt="{1}"'.format(element.uri, element.alt)
+    if element.width:
+        html += ' width="{0}"'.format(element.width)
+    if element.height:
+        html += ' height="{0}"'.format(element.height)
+    return html + ' class="biian_image-content" />'
+
+
+def render_colspec(element):
+    html = '<colspec colname="{0}"'.format(element.colname)
+    if element.width:
+        html += ' width="{0}"'.format(element.width)
+    return html + ' scale="{0}" />'.format(element.scale)
+
+
+def render_bullet_list(element):
+    return '<ul>{0}</ul>'.format(_each(element, '\n  {0}\n'))
+
+
+def render_enumerated_list(element):
+    return '<ol>{0}</ol>'.format(_each(element, '\n  {0}\n'))
+
+
+def render_definition_list(element):
+    return '<dl>{0}</dl>'.format(_each(element, '\n  {0}\n'))
+
+
+def render_list_item(element):
+    return '<li>{0}</li>'.format(_each(element, '{0}'))
+
+
+def render_block_quote(element):
+    return '<blockquote>\n{0}\n</blockquote>'.format(_each(element, '\n{0}\n'))
+
+
+def render_note(element):
+    return '<div class="note">{0}</div>'.format(_each(element, '\n{0}\n'))
+
+
+def _wrap(tag):
+    def render(element):
+        return '<{0}>\n{1}\n</{0}>'.format(tag, _each(element, '{0}'))
+    render.__name__ = 'render_{0}'.format(tag)
+    return render
+
+
+def render_row(element):
+    return '<tr><row>\n{0}\n</row></tr>'.format(_each(element, '<td>\n{0}\n</td>'))
+
+
+def render_header_row(element):
+    return '<tr><row>\n{0}\n</row></tr>'.format(_each(element, '<th>\n{0}\n</th>'))
+
+
+def render_table(element):
+    return (
+        '<table>\n  <caption class="biisan-table-caption">{0}</caption>\n{1}\n</table>'
+    ).format(getattr(element.title, 'text', ''), _each(element, '{0}'))
+
+
+RENDERERS = {
+    'components/strong.html': render_strong,
+    'components/emphasis.html': render_emphasis,
+    'components/literal.html': render_literal,
+    'components/literalblock.html': render_literal_block,
+    'components/raw.html': render_raw,
+    'components/reference.html': render_reference,
+    'components/target.html': render_target,
+    'components/transition.html': render_transition,
+    'components/caption.html': render_caption,
+    'components/paragraph.html': render_paragraph,
+    'components/image.html': render_image,
+    'components/colspec.html': render_colspec,
+    'components/bulletlist.html': render_bullet_list,
+    'components/enumeratedlist.html': render_enumerated_list,
+    'components/definitionlist.html': render_definition_list,
+    'components/listitem.html': render_list_item,
+    'components/blockquote.html': render_block_quote,
+    'components/note.html': render_note,
+    'components/entry.html': _wrap('entry'),
+    'components/figure.html': _wrap('figure'),
+    'components/tbody.html': _wrap('tbody'),
+    'components/tgroup.html': _wrap('tgroup'),
+    'components/thead.html': _wrap('thead'),
+    'components/row.html': render_row,
+    'components/header_row.html': render_header_row,
+    'components/table.html': render_table,
+}
+
+_resolved = {}
+
+
+def _is_builtin(env, template_name):
+    loader = env.loader
+    if not isinstance(loader, FileSystemLoader):
+        return False
+    for searchpath in loader.searchpath:
+        if os.path.isfile(os.path.join(searchpath, template_name)):
+            return os.path.realpath(searchpath) == BUILTIN_TEMPLATE_DIR
+    return False
+
+
+def clear_resolved():
+    """
+    Look up again whether templates are overridden, e.g. after templates
+    were added to template_dirs.
+    """
+    _resolved.clear()
+
+
+def get_renderer(env, template_name):
+    """
+    Return the Python renderer for template_name, or None when there is
+    none or the template is overridden in env.
+    """
+    key = (id(env), template_name)
+    if key not in _resolved:
+        renderer = RENDERERS.get(template_name)
+        if renderer is not None and not _is_builtin(env, template_name):
+            renderer = None
+        _resolved[key] = renderer
+    return _resolved[key]
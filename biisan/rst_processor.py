@@ -0,0 +1,218 @@
+"""
+reStructuredText front ends for biisan.
+
+Setting up docutils (option parser, settings, reader, parser and writer)
+costs more than parsing a typical short story, so the components are built
+once per process and reused for every document.
+
+Two front ends feed the processors:
+
+- ``xml``: the doctree is serialized by the docutils XML writer and read
+  back with ElementTree, as biisan has always done.
+- ``doctree``: the doctree is walked directly through DoctreeElement, which
+  exposes the part of the ElementTree Element interface used by processors.
+"""
+import xml.etree.ElementTree as ET
+
+from docutils import nodes
+from docutils.core import Publisher
+from docutils.io import StringInput, StringOutput
+from docutils.nodes import serial_escape
+
+
+_XML_ATTRIBUTE_NAMES = {
+    'xml:space': '{http://www.w3.org/XML/1998/namespace}space',
+}
+
+
+class RstEngine(object):
+    """
+    A docutils Publisher configured once and reused for many documents.
+    """
+
+    def __init__(self, settings_overrides=None):
+        self.settings_overrides = dict(settings_overrides or {})
+        self.publisher = Publisher(
+            source_class=StringInput, destination_class=StringOutput)
+        self.publisher.set_components('standalone', 'restructuredtext', 'xml')
+        self.publisher.process_programmatic_settings(
+            None, self.settings_overrides, None)
+
+    def publish(self, rst_text):
+        """
+        Returns:
+            str: the document serialized by the docutils XML writer
+        """
+        self.publisher.set_source(rst_text)
+        self.publisher.set_destination()
+        self.publisher.publish()
+        return self.publisher.writer.parts['whole']
+
+    def read(self, rst_text):
+        """
+        Parse and transform without serializing.
+
+        Returns:
+            docutils.nodes.document
+        """
+        publisher = self.publisher
+        publisher.set_source(rst_text)
+        publisher.set_destination()
+        publisher.document = publisher.reader.read(
+            publisher.source, publisher.parser, publisher.settings)
+        publisher.apply_transforms()
+        return publisher.document
+
+
+def _attribute_value(value):
+    # Same serialization as docutils.nodes.Element.starttag
+    if value is None:
+        return 'True'
+    if isinstance(value, list):
+        return ' '.join(serial_escape('%s' % (v,)) for v in value)
+    return str(value)
+
+
+def _join_text(parts):
+    return ''.join(parts) or None
+
+
+def _itertext(node):
+    for child in node.children:
+        if isinstance(child, nodes.Text):
+            text = child.astext()
+            if text:
+                yield text
+        else:
+            yield from _itertext(child)
+
+
+class DoctreeElement(object):
+    """
+    Read-only view of a docutils node that behaves like the ElementTree
+    element the XML front end would have produced for it: ``tag``,
+    ``text``, ``tail``, ``items()``, ``get()``, ``itertext()``, ``len()``,
+    indexing and iteration over child elements.
+    """
+
+    __slots__ = ('node', 'tail', '_children', '_attrib')
+
+    def __init__(self, node, tail=None):
+        self.node = node
+        self.tail = tail
+        self._children = None
+        self._attrib = None
+
+    def __repr__(self):
+        return '<DoctreeElement {0!r}>'.format(self.tag)
+
+    @property
+    def tag(self):
+        return self.node.tagname
+
+    @property
+    def text(self):
+        parts = []
+        for child in self.node.children:
+            if not isinstance(child, nodes.Text):
+                break
+            parts.append(child.astext())
+        return _join_text(parts)
+
+    @property
+    def attrib(self):
+        if self._attrib is None:
+            self._attrib = {
+                _XML_ATTRIBUTE_NAMES.get(name, name): _attribute_value(value)
+                for name, value in self.node.attlist()
+            }
+        return self._attrib
+
+    def items(self):
+        return list(self.attrib.items())
+
+    def keys(self):
+        return list(self.attrib.keys())
+
+    def get(self, key, default=None):
+        return self.attrib.get(key, default)
+
+    def _elements(self):
+        if self._children is None:
+            children = []
+            tail = []
+            for child in self.node.children:
+                if isinstance(child, nodes.Text):
+                    tail.append(child.astext())
+                    continue
+                if children:
+                    children[-1].tail = _join_text(tail)
+                tail = []
+                children.append(DoctreeElement(child))
+            if children:
+                children[-1].tail = _join_text(tail)
+            self._children = children
+        return self._children
+
+    def __len__(self):
+        return len(self._elements())
+
+    def __iter__(self):
+        return iter(self._elements())
+
+    def __getitem__(self, index):
+        return self._elements()[index]
+
+    def find(self, tag):
+        for child in self._elements():
+            if child.tag == tag:
+                return child
+        return None
+
+    def findall(self, tag):
+        return [child for child in self._elements() if child.tag == tag]
+
+    def itertext(self):
+        return _itertext(self.node)
+
+
+_engine = None
+
+
+def get_engine(settings_overrides=None):
+    """
+    Return this process's RstEngine, rebuilding it only when the
+    settings overrides change.
+    """
+    global _engine
+    if _engine is None or _engine.settings_overrides != (settings_overrides or {}):
+        _engine = RstEngine(settings_overrides)
+    return _engine
+
+
+def parse_rst_to_doctree(rst_text, settings_overrides=None):
+    """
+    Parse reStructuredText without the XML writer round trip.
+
+    Args:
+        rst_text: reStructuredText source
+        settings_overrides: docutils settings overrides
+
+    Returns:
+        DoctreeElement: Root ``document`` element
+    """
+    return DoctreeElement(get_engine(settings_overrides).read(rst_text))
+
+
+def parse_rst_to_xml(rst_text, settings_overrides=None):
+    """
+    Parse reStructuredText and convert it to an XML ElementTree.
+
+    Args:
+        rst_text: reStructuredText source
+        settings_overrides: docutils settings overrides
+
+    Returns:
+        xml.etree.ElementTree.Element: Root ``document`` element
+    """
+    return ET.fromstring(get_engine(settings_overrides).publish(rst_text))
@@ -0,0 +1,262 @@
+"""
+Preview server rendering pages on request.
+
+    $ biisan serve --port 8000
+
+Pages are rendered from the stories in memory when they are requested,
+nothing is written to dir.output. Other files, such as images, are served
+from dir.output. Rendered pages are kept in a LRU cache together with the
+signature of their inputs, so a page is rendered again only after one of
+its stories or templates changed. Changes are found like biisan watch
+finds them.
+"""
+import http.server
+import logging
+import mimetypes
+import os
+import time
+from collections import OrderedDict
+from urllib.parse import unquote, urlsplit
+
+from glueplate import config
+
+import biisan
+from biisan import generate
+from biisan.build_graph import BuildGraph
+from biisan.story_index import StoryIndex, latest
+from biisan.utils import get_environment
+from biisan.watch import Session, create_watcher, watched_directories
+
+
+logger = logging.getLogger(__name__)
+
+HTML = 'text/html; charset=utf-8'
+XML = 'application/xml; charset=utf-8'
+
+
+def _digests(story_list):
+    return [story.source_digest for story in story_list]
+
+
+class Site(object):
+    """
+    Stories in memory and the pages rendered from them.
+
+    Attributes:
+        pages: OrderedDict of URL path to (signature, body), least
+            recently used first
+    """
+
+    def __init__(self, watcher=None, cache_size=256):
+        self.session = Session()
+        self.watcher = watcher
+        self.cache_size = cache_size
+        self.pages = OrderedDict()
+        self.index = StoryIndex([])
+        self._graph = None
+        self._story_by_url = {}
+        self._checked = None
+
+    def start(self):
+        self.session.collect()
+        self._reindex()
+
+    def _reindex(self):
+        # A new graph, so template digests are computed again
+        self._graph = BuildGraph(None, get_environment(config), config.settings)
+        self.index = StoryIndex(self.session.stories[x] for x in sorted(self.session.stories))
+        stories = self.index.stories
+        for i, story in enumerate(stories):
+            story.prepare_html(stories, i)
+        self._story_by_url = {story.url: story for story in stories}
+        if not stories:
+            logger.error('NO ENTRY FOUND.')
+
+    def refresh(self):
+        """
+        Pick up changed stories and templates.
+        """
+        if self.watcher is None:
+            return
+        # Polling walks every watched file, so not on every request
+        now = time.monotonic()
+        interval = getattr(self.watcher, 'interval', 0)
+        if self._checked is not None and now - self._checked < interval:
+            return
+        self._checked = now
+        changed = self.watcher.changes()
+        if changed:
+            if self.session.read_changes(changed):
+                # Also drops cached templates, so new overrides are used
+                self.session.reload_templates()
+            # A new build graph digests the templates again
+            self._reindex()
+
+    def _extra(self, name):
+        extra_page = generate.unmarshal_story('./extra/{0}.rst'.format(name))
+        extra_page.extra = name
+        extra_page.extra_directory(name)
+        extra_page.prepare_html([extra_page], 0)
+        return extra_page
+
+    def _top_context(self):
+        context = {}
+        context['config'] = config
+        context['story_list'] = self.index.stories
+        context['latest_story_list'] = self.index.latest(config.settings.latest_list_count)
+        for extra in config.settings.extra:
+            context[extra] = self._extra(extra)
+        return context
+
+    def route(self, path):
+        """
+        Args:
+            path: URL path ending with /
+
+        Returns:
+            tuple: (content type, signature, function rendering the page),
+                or None when no page has that path
+        """
+        index = self.index
+        signature = self._graph.signature
+        story = self._story_by_url.get(path)
+        if story is not None:
+            return HTML, generate.story_signature(self._graph, story), lambda: generate.render_story(story)
+        parts = path.strip('/').split('/')
+        if path == '/':
+            context = self._top_context()
+            inputs = [_digests(index.stories), _digests(context['latest_story_list'])]
+            inputs.extend(context[x].source_digest for x in config.settings.extra)
+            return HTML, signature('index.html', inputs), lambda: generate.render_top(context)
+        if len(parts) == 1 and parts[0] in config.settings.extra:
+            extra_page = self._extra(parts[0])
+            return HTML, generate.story_signature(self._graph, extra_page), extra_page.to_html
+        if not index.stories:
+            return None
+        if path == '/blog/':
+            return HTML, signature('blog_top.html', index.digests), lambda: generate.render_blog_top(index)
+        if path == '/blog/all/':
+            return HTML, signature('blog_all.html', index.digests), lambda: generate.render_all_entry(index)
+        if path == '/api/google_sitemaps/':
+            return XML, signature('sitemaps.xml', index.digests), lambda: generate.render_sitemaps(index)
+        if path == '/api/feed/':
+            latest_story_list = index.latest(config.settings.latest_list_count)
+            return (XML, signature('rss20.xml', _digests(latest_story_list)),
+                    lambda: generate.render_rss20(latest_story_list))
+        if len(parts) == 3 and parts[:2] == ['api', 'feed'] and parts[2] in index.by_category:
+            latest_story_list = latest(index.by_category[parts[2]], config.settings.latest_list_count)
+            return (XML, signature('rss20.xml', parts[2], _digests(latest_story_list)),
+                    lambda: generate.render_rss20(latest_story_list))
+        if len(parts) == 3 and parts[0] == 'blog':
+            year_month = '/'.join(parts[1:])
+            stories = index.by_year_month.get(year_month)
+            if stories is not None:
+                return (HTML, signature('blog_archive.html', year_month, _digests(stories)),
+                        lambda: generate.render_blog_archive(year_month, stories))
+        return None
+
+    def page(self, path):
+        """
+        Returns:
+            tuple: (content type, body), or None when no page has that path
+        """
+        route = self.route(path)
+        if route is None:
+            return None
+        content_type, signature, render = route
+        cached = self.pages.get(path)
+        if cached is None or cached[0] != signature:
+            cached = self.pages[path] = (signature, render().encode('utf8'))
+        self.pages.move_to_end(path)
+        while len(self.pages) > self.cache_size:
+            self.pages.popitem(last=False)
+        return content_type, cached[1]
+
+    def static_file(self, path):
+        """
+        Returns:
+            str: file under dir.output for the URL path, or None
+        """
+        output = os.path.realpath(os.path.expanduser(config.settings.dir.output))
+        pth = os.path.realpath(os.path.join(output, path.lstrip('/')))
+        if os.path.commonpath([output, pth]) != output:
+            return None
+        if os.path.isdir(pth):
+            pth = os.path.join(pth, 'index.html')
+        return pth if os.path.isfile(pth) else None
+
+    def close(self):
+        if self.watcher is not None:
+            self.watcher.close()
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    server_version = 'biisan/{0}'.format(biisan.__version__)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _respond(self, send_body):
+        site = self.server.site
+        path = unquote(urlsplit(self.path).path)
+        for name in ('index.html', 'index.xml'):
+            if path.endswith('/' + name):
+                path = path[:-len(name)]
+        try:
+            site.refresh()
+            if not path.endswith('/') and site.route(path + '/') is not None:
+                self.send_response(301)
+                self.send_header('Location', path + '/')
+                self.end_headers()
+                return
+            page = site.page(path)
+        except Exception:
+            logger.exception('Failed to render %s', path)
+            self.send_error(500)
+            return
+        if page is None:
+            pth = site.static_file(path)
+            if pth is None:
+                self.send_error(404)
+                return
+            with open(pth, 'rb') as f:
+                body = f.read()
+            page = mimetypes.guess_type(pth)[0] or 'application/octet-stream', body
+        content_type, body = page
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info('%s %s', self.address_string(), format % args)
+
+
+def create_server(site, bind='127.0.0.1', port=8000):
+    server = http.server.HTTPServer((bind, port), RequestHandler)
+    server.site = site
+    return server
+
+
+def serve(bind='127.0.0.1', port=8000):
+    """
+    Serve the site until interrupted.
+    """
+    generate.prepare()
+    site = Site(create_watcher(watched_directories()), config.settings.serve_cache_size)
+    site.start()
+    server = create_server(site, bind, port)
+    logger.info('Serving on http://%s:%d/, press Ctrl-C to stop', bind, server.server_port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        site.close()
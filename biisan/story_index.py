@@ -0,0 +1,115 @@
+"""
+Indexes over the collected stories, built once and shared by every page
+that lists stories: blog top, archives, feeds, sitemaps and all entries.
+"""
+import logging
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+
+def story_sort_key(story):
+    """
+    Sort key for stories: the publish timestamp. Sorting is stable, so
+    stories published at the same time keep the order they were found in.
+    """
+    timestamp = story._timestamp
+    if timestamp is None:
+        logger.error('Story without date: %s', story.source_file)
+        raise ValueError('date must not be None: {0}'.format(story.source_file))
+    return timestamp
+
+
+def latest(stories, count):
+    """
+    Returns:
+        list: the count newest of stories sorted oldest first, newest first
+    """
+    if count <= 0:
+        return []
+    return stories[:-count - 1:-1]
+
+
+def _to_timestamp(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return value.timestamp()
+
+
+class StoryIndex(object):
+    """
+    Stories ordered by publish date (oldest first) with lookups by year,
+    month, category and slug.
+
+    Attributes:
+        stories: list of stories, oldest first
+        year_month: OrderedDict of year to its sorted months
+        by_year_month: OrderedDict of 'YYYY/MM' to its stories
+        by_category: dict of category to its stories
+        by_slug: dict of slug to its stories
+    """
+
+    def __init__(self, stories):
+        self.stories = sorted(stories, key=story_sort_key)
+        self._timestamps = [story._timestamp for story in self.stories]
+        self._digests = None
+        self.year_month = OrderedDict()
+        self.by_year_month = OrderedDict()
+        self.by_category = {}
+        self.by_slug = {}
+        for story in self.stories:
+            date = story.date
+            months = self.year_month.setdefault(date.year, [])
+            if date.month not in months:
+                insort(months, date.month)
+            key = '{0:04d}/{1:02d}'.format(date.year, date.month)
+            self.by_year_month.setdefault(key, []).append(story)
+            if story.has_additional_meta('category'):
+                self.by_category.setdefault(story.category, []).append(story)
+            self.by_slug.setdefault(story.slug, []).append(story)
+
+    def __len__(self):
+        return len(self.stories)
+
+    def __iter__(self):
+        return iter(self.stories)
+
+    def latest(self, count):
+        """
+        Returns:
+            list: the count newest stories, newest first
+        """
+        return latest(self.stories, count)
+
+    def between(self, start=None, end=None):
+        """
+        Stories published in [start, end). Either bound may be None.
+
+        Args:
+            start: datetime or timestamp
+            end: datetime or timestamp
+        """
+        start, end = _to_timestamp(start), _to_timestamp(end)
+        lo = 0 if start is None else bisect_left(self._timestamps, start)
+        hi = len(self.stories) if end is None else bisect_left(self._timestamps, end)
+        return self.stories[lo:hi]
+
+    def month(self, year, month):
+        return self.by_year_month.get('{0:04d}/{1:02d}'.format(year, month), [])
+
+    @property
+    def last_modified(self):
+        """
+        The date of the newest story, or None without stories.
+        """
+        if not self.stories:
+            return None
+        return self.stories[-1].date
+
+    @property
+    def digests(self):
+        if self._digests is None:
+            self._digests = [story.source_digest for story in self.stories]
+        return self._digests
@@ -1,5 +1,13 @@
 from importlib import import_module
-from jinja2 import Environment, FileSystemLoader
+import os
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+from biisan import renderers
+from biisan.cache import fingerprint
+
+
+_environments = {}
 
 
 def get_klass(pth):
@@ -10,8 +18,30 @@ def get_klass(pth):
     return getattr(mod, class_name)
 
 
-def get_environment(config):
-    env = Environment(loader=FileSystemLoader(config.settings.template_dirs))
+class BytecodeCache(FileSystemBytecodeCache):
+    """
+    FileSystemBytecodeCache that creates its directory on first write.
+    The directory is relative to the working directory at that time, like
+    the other caches under dir.cache.
+    """
+
+    def dump_bytecode(self, bucket):
+        os.makedirs(self.directory, exist_ok=True)
+        super().dump_bytecode(bucket)
+
+
+def template_bytecode_directory(config):
+    return os.path.join(os.path.expanduser(config.settings.dir.cache), 'jinja')
+
+
+def create_environment(config):
+    bytecode_cache = None
+    if config.settings.template_bytecode_cache:
+        bytecode_cache = BytecodeCache(template_bytecode_directory(config))
+    env = Environment(
+        loader=FileSystemLoader(config.settings.template_dirs),
+        bytecode_cache=bytecode_cache,
+    )
     for filter_name, filter_func in config.settings.custom_filters.items():
         env.filters[filter_name] = filter_func
     for func_name, func in config.settings.template_functions.items():
@@ -19,4 +49,56 @@ def get_environment(config):
     return env
 
 
+def get_environment(config):
+    """
+    Return the Jinja environment shared by this process, so each template
+    is compiled (or loaded from the bytecode cache) only once.
+    A new environment is created when the template settings change.
+    """
+    key = fingerprint(
+        config.settings.template_dirs,
+        config.settings.custom_filters,
+        config.settings.template_functions,
+        config.settings.template_bytecode_cache and template_bytecode_directory(config),
+    )
+    env = _environments.get(key)
+    if env is None:
+        env = _environments[key] = create_environment(config)
+    return env
+
+
+def clear_template_caches(env):
+    """
+    Forget the templates env loaded and the renderers chosen for them.
+    Jinja reloads a changed template by itself, but keeps using the file
+    it found first when a template is added to an earlier template_dirs
+    entry.
+    """
+    env.cache.clear()
+    renderers.clear_resolved()
+
+
+def warm_templates(env):
+    """
+    Load every template into env's in-memory cache.
+
+    Returns:
+        list: names of the loaded templates
+    """
+    names = env.list_templates()
+    for name in names:
+        env.get_template(name)
+    return names
+
+
+def compile_templates(config):
+    """
+    Compile every template in template_dirs into the bytecode cache.
+
+    Returns:
+        list: names of the compiled templates
+    """
+    return warm_templates(create_environment(config))
+
+
 get_function = get_klass
@@ -0,0 +1,293 @@
+"""
+Rebuild the site whenever a story, extra page or template changes.
+
+    $ biisan watch
+
+The process keeps the collected stories, the Jinja environment and the
+render workers between builds. A changed story is read again on its own
+and the build graph renders only the pages it affects. A changed template
+also restarts the render workers, so they render with the new templates.
+Restart watch after changing biisan_local_settings.py.
+"""
+import logging
+import os
+import time
+
+from glueplate import config
+
+from biisan import generate
+from biisan.utils import clear_template_caches, get_environment
+
+
+logger = logging.getLogger(__name__)
+
+BLOG_DIRECTORY = './blog'
+EXTRA_DIRECTORY = './extra'
+
+
+def watched_directories():
+    return [BLOG_DIRECTORY, EXTRA_DIRECTORY] + list(config.settings.template_dirs)
+
+
+def _walk_files(directories):
+    # Hidden files and directories are skipped, like editor swap files
+    for directory in directories:
+        for dirpath, dirnames, filenames in os.walk(directory, followlinks=True):
+            dirnames[:] = [x for x in dirnames if not x.startswith('.')]
+            for filename in filenames:
+                if not filename.startswith('.'):
+                    yield os.path.join(dirpath, filename)
+
+
+def snapshot(directories):
+    """
+    Returns:
+        dict: (size, mtime_ns, inode) of every file under directories
+    """
+    files = {}
+    for pth in _walk_files(directories):
+        try:
+            st = os.stat(pth)
+        except FileNotFoundError:
+            continue
+        files[pth] = (st.st_size, st.st_mtime_ns, st.st_ino)
+    return files
+
+
+class PollingWatcher(object):
+    """
+    Finds changed files by comparing stat snapshots every interval seconds.
+    """
+
+    def __init__(self, directories, interval=0.5):
+        self.directories = directories
+        self.interval = interval
+        self._snapshot = snapshot(directories)
+
+    def changes(self):
+        """
+        Returns:
+            list: paths added, changed or removed since the last call
+        """
+        current = snapshot(self.directories)
+        changed = sorted(
+            pth for pth in self._snapshot.keys() | current.keys()
+            if self._snapshot.get(pth) != current.get(pth))
+        self._snapshot = current
+        return changed
+
+    def wait(self):
+        while True:
+            changed = self.changes()
+            if changed:
+                return changed
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """
+    Waits for inotify events instead of polling. Needs Linux and the
+    inotify_simple package.
+    """
+
+    def __init__(self, directories, delay=0.05):
+        from inotify_simple import INotify, flags
+
+        self.delay = delay
+        self._flags = flags
+        self._mask = (flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE | flags.DELETE |
+                      flags.MOVED_FROM | flags.MOVED_TO)
+        self._inotify = INotify()
+        self._directories = {}
+        for directory in directories:
+            self._add_tree(directory)
+
+    def _add_tree(self, directory):
+        for dirpath, dirnames, _ in os.walk(directory, followlinks=True):
+            dirnames[:] = [x for x in dirnames if not x.startswith('.')]
+            try:
+                wd = self._inotify.add_watch(dirpath, self._mask)
+            except OSError:
+                continue
+            self._directories[wd] = dirpath
+
+    def _read(self, timeout):
+        flags = self._flags
+        changed = set()
+        # Collect the events of one save, e.g. a write and a rename
+        for event in self._inotify.read(timeout=timeout, read_delay=int(self.delay * 1000)):
+            if event.mask & flags.IGNORED:
+                self._directories.pop(event.wd, None)
+                continue
+            directory = self._directories.get(event.wd)
+            if directory is None or not event.name or event.name.startswith('.'):
+                continue
+            pth = os.path.join(directory, event.name)
+            if event.mask & flags.ISDIR:
+                if event.mask & (flags.CREATE | flags.MOVED_TO):
+                    self._add_tree(pth)
+                    changed.update(_walk_files([pth]))
+                continue
+            changed.add(pth)
+        return sorted(changed)
+
+    def changes(self):
+        """
+        Returns:
+            list: paths changed since the last call, without waiting
+        """
+        return self._read(0)
+
+    def wait(self):
+        while True:
+            changed = self._read(None)
+            if changed:
+                return changed
+
+    def close(self):
+        self._inotify.close()
+
+
+def create_watcher(directories):
+    backend = config.settings.watch_backend
+    if backend == 'auto':
+        try:
+            return InotifyWatcher(directories)
+        except (ImportError, OSError):
+            backend = 'poll'
+    if backend == 'inotify':
+        return InotifyWatcher(directories)
+    if backend == 'poll':
+        return PollingWatcher(directories, config.settings.watch_interval)
+    raise ValueError('Unknown watch_backend: {0}'.format(backend))
+
+
+def _under(pth, directory):
+    return os.path.normpath(pth).startswith(os.path.normpath(directory) + os.sep)
+
+
+class Session(object):
+    """
+    Stories and render workers kept from one build to the next.
+
+    Attributes:
+        stories: dict of normalized source path to Story, or StoryRecord
+            with lightweight_stories
+    """
+
+    def __init__(self):
+        self.stories = {}
+        self.pool = None
+
+    def open_pool(self):
+        """
+        Start the workers, which then parse and render until close().
+        """
+        if self.pool is None:
+            self.pool = generate.open_render_pool()
+
+    def collect(self):
+        self.stories = {
+            os.path.normpath(story.source_file): story for story in generate.collect_stories(self.pool)}
+
+    def start(self):
+        self.open_pool()
+        self.collect()
+        self.build()
+
+    def update(self, changed):
+        """
+        Read changed stories again and build.
+
+        Args:
+            changed: paths of added, changed or removed files
+        """
+        if self.read_changes(changed):
+            self.reload_templates()
+        self.build()
+
+    def read_changes(self, changed):
+        """
+        Read changed stories again.
+
+        Returns:
+            bool: True when a template changed
+        """
+        templates = False
+        for pth in changed:
+            logger.info('Changed: %s', pth)
+            if _under(pth, BLOG_DIRECTORY):
+                if not pth.endswith(generate.STORY_EXTENSIONS):
+                    continue
+                if os.path.exists(pth):
+                    self.stories[os.path.normpath(pth)] = generate.collect_story(pth)
+                else:
+                    self.stories.pop(os.path.normpath(pth), None)
+            elif not _under(pth, EXTRA_DIRECTORY):
+                # Extra pages are read again on every build anyway
+                templates = True
+        return templates
+
+    def reload_templates(self):
+        # Template digests are part of the fragment cache salt and of
+        # every build graph signature; workers hold the old caches.
+        clear_template_caches(get_environment(config))
+        generate.register_fragment_cache()
+        generate.register_build_graph()
+        for story in self.stories.values():
+            if getattr(story, 'body_fragment', None) is not None:
+                story.body_fragment = None
+        self.close()
+
+    def build(self):
+        if not self.stories:
+            logger.error('NO ENTRY FOUND.')
+            return
+        start = time.monotonic()
+        generate.output_writer.reset()
+        self.open_pool()
+        failed = True
+        try:
+            # In path order, as collected, so stories of the same date
+            # keep the order of a full build
+            generate.build([self.stories[x] for x in sorted(self.stories)], self.pool)
+            failed = False
+        finally:
+            if failed:
+                generate.close_render_pool(self.pool, failed=True)
+                self.pool = None
+        generate.save_build_state()
+        generate.log_output_report()
+        logger.info('Built %d stories in %.2fs', len(self.stories), time.monotonic() - start)
+
+    def close(self):
+        generate.close_render_pool(self.pool)
+        self.pool = None
+
+
+def watch(watcher=None):
+    """
+    Build, then rebuild on every change until interrupted.
+    """
+    generate.prepare()
+    # Started before the first build, so changes made meanwhile are seen
+    if watcher is None:
+        watcher = create_watcher(watched_directories())
+    session = Session()
+    try:
+        session.start()
+        logger.info('Watching for changes, press Ctrl-C to stop')
+        while True:
+            changed = watcher.wait()
+            try:
+                session.update(changed)
+            except Exception:
+                logger.exception('Build failed, waiting for the next change')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        session.close()
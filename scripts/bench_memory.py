@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Memory used by parsed stories, per document node.
+
+Run it in a data directory, like a build:
+
+    $ cd biisan_data/data
+    $ BIISAN_SETTINGS_MODULE=biisan_local_settings python /path/to/scripts/bench_memory.py
+
+Every story under ./blog is parsed in this process (the parse cache is
+bypassed) and two numbers are reported:
+
+- traced bytes per node: everything allocated while parsing that is still
+  alive afterwards (tracemalloc), including text and docinfo
+- object bytes per node: the node objects themselves (sys.getsizeof of the
+  instance, its __dict__ if it has one, and its contents list)
+"""
+import argparse
+import gc
+import sys
+import tracemalloc
+from collections import Counter
+
+import biisan  # noqa: F401  sets up glueplate before config is imported
+from glueplate import config
+
+
+def iter_nodes(node):
+    for content in getattr(node, 'contents', ()) or ():
+        yield content
+        yield from iter_nodes(content)
+
+
+def object_size(node):
+    size = sys.getsizeof(node)
+    if hasattr(node, '__dict__'):
+        size += sys.getsizeof(node.__dict__)
+    contents = getattr(node, 'contents', None)
+    if isinstance(contents, list):
+        size += sys.getsizeof(contents)
+    return size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--by-class', action='store_true', help='break object bytes down by node class')
+    args = parser.parse_args(argv)
+
+    from biisan import generate
+
+    config.settings['parse_cache'] = False
+    generate.prepare()
+    paths = generate.discover_documents('./blog')
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    stories = [generate.unmarshal_story(pth) for pth in paths]
+    gc.collect()
+    traced = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    nodes = [node for story in stories for node in iter_nodes(story)]
+    if not nodes:
+        sys.exit('No story nodes found under ./blog')
+    sizes = Counter()
+    counts = Counter()
+    for node in nodes:
+        sizes[type(node).__name__] += object_size(node)
+        counts[type(node).__name__] += 1
+
+    print('stories: {0}'.format(len(stories)))
+    print('nodes: {0}'.format(len(nodes)))
+    print('traced bytes per node: {0}'.format(traced // len(nodes)))
+    print('object bytes per node: {0}'.format(sum(sizes.values()) // len(nodes)))
+    if args.by_class:
+        for name, count in counts.most_common():
+            print('  {0}: {1} nodes, {2} bytes each'.format(name, count, sizes[name] // count))
+
+
+if __name__ == '__main__':
+    main()
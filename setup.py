@@ -43,6 +43,7 @@ setup(
     zip_safe=False,
     install_requires=requirements,
     packages=['biisan', 'biisan.directives', 'biisan.processors'],
+    scripts=['scripts/biisan'],
     package_data={
           'biisan': ['templates/*', 'templates/components/*', ],
     },
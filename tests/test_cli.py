@@ -0,0 +1,94 @@
+from pathlib import Path
+
+from biisan.main import (
+    initialize_structures,
+)
+
+from ._constants import (
+    ANSWER,
+    DATA_DIR,
+)
+from ._utils import (  # noqa
+    cd,
+    cleanup,
+    copy_first_blog,
+    copy_second_blog,
+    copy_test_local_settings,
+    setenv,
+)
+
+
+def test_compile_templates(capsys):
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+
+        # settings resolve paths against the directory they are loaded in
+        from glueplate import config
+
+        with cd('biisan_data/data'):
+            from biisan.cli import main
+            from biisan.utils import get_environment
+
+            main(['compile-templates'])
+            assert 'Compiled' in capsys.readouterr().out
+            compiled = list((Path('.biisan_cache') / 'jinja').iterdir())
+            assert len(compiled) == len(get_environment(config).list_templates())
+            assert get_environment(config) is get_environment(config)
+
+
+def test_indexes():
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        from glueplate import config
+
+        with cd('biisan_data/data'):
+            from biisan.cli import main
+
+            main(['indexes'])
+            out = Path(config.settings.dir.output)
+            assert (out / 'blog' / 'index.html').exists()
+            assert (out / 'api' / 'feed' / 'index.xml').exists()
+            assert not (out / 'blog' / '2019' / '04' / '06' / 'my_first_blog' / 'index.html').exists()
+
+
+def test_cache_stats_and_clear(capsys):
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+
+        with cd('biisan_data/data'):
+            from biisan.cli import main
+            from biisan.generate import main as generate, prepare
+
+            prepare()
+            generate()
+            main(['cache', 'stats'])
+            out = capsys.readouterr().out
+            assert 'outputs: 2 entries' in out
+            main(['cache', 'clear'])
+            assert not Path('.biisan_cache').exists()
+
+
+def test_startup_report(capsys, monkeypatch):
+    import os
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+
+        with cd('biisan_data/data'):
+            from biisan.cli import main
+
+            # the settings module is imported as tests.biisan_data...
+            monkeypatch.setenv('PYTHONPATH', os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+            main(['startup-report', '--limit', '5'])
+            out = capsys.readouterr().out
+            assert out.startswith('import biisan.generate: ')
+            assert 'Lazy libraries loaded: none' in out
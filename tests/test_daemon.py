@@ -0,0 +1,103 @@
+from pathlib import Path
+
+from biisan.main import (
+    initialize_structures,
+)
+
+from ._constants import (
+    ANSWER,
+    DATA_DIR,
+)
+from ._utils import (  # noqa
+    cd,
+    cleanup,
+    copy_first_blog,
+    copy_second_blog,
+    copy_test_local_settings,
+    setenv,
+)
+
+
+def test_build_through_daemon(monkeypatch):
+    import io
+    import threading
+
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            from biisan.daemon import close, create_server, request, socket_path
+            from glueplate import config
+
+            monkeypatch.setitem(config.settings, 'watch_backend', 'poll')
+            assert request() is None
+            server = create_server()
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                log = io.StringIO()
+                assert request(stream=log) is True
+                assert 'story: written=2' in log.getvalue()
+                page = Path(config.settings.dir.output) / 'blog' / '2019' / '04' / '06' / 'my_first_blog' / 'index.html'
+                assert page.exists()
+
+                source = Path('blog') / 'my_first_blog.rst'
+                source.write_text(source.read_text() + '\nDaemon paragraph.\n')
+                log = io.StringIO()
+                assert request(stream=log) is True
+                assert 'story: written=1' in log.getvalue()
+                assert 'Daemon paragraph.' in page.read_text()
+            finally:
+                server.shutdown()
+                thread.join()
+                close(server)
+            assert not Path(socket_path()).exists()
+
+
+def test_daemon_reloads_templates(monkeypatch):
+    import io
+    import os
+    import threading
+
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+
+        with cd('biisan_data/data'):
+            from biisan.daemon import close, create_server, request
+            from biisan.models import HTMLize
+            from biisan.utils import get_environment
+            from glueplate import config
+
+            monkeypatch.setitem(config.settings, 'watch_backend', 'poll')
+            monkeypatch.setitem(config.settings, 'render_multiprocess', 1)
+            monkeypatch.setitem(config.settings, 'template_dirs', [
+                str(Path('templates').absolute()), config.settings.template_dirs[-1]])
+            monkeypatch.setattr(HTMLize, 'env', get_environment(config))
+            server = create_server()
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                assert request(stream=io.StringIO()) is True
+                page = Path(config.settings.dir.output) / 'blog' / '2019' / '04' / '06' / 'my_first_blog' / 'index.html'
+                assert 'daemon-paragraph' not in page.read_text()
+
+                override = Path('templates', 'components', 'paragraph.html')
+                override.parent.mkdir()
+                override.write_text('<p class="daemon-paragraph">{{ element.formated }}</p>')
+                assert request(stream=io.StringIO()) is True
+                assert 'daemon-paragraph' in page.read_text()
+
+                override.write_text('<p class="edited-paragraph">{{ element.formated }}</p>')
+                st = override.stat()
+                os.utime(override, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+                assert request(stream=io.StringIO()) is True
+                assert 'edited-paragraph' in page.read_text()
+            finally:
+                server.shutdown()
+                thread.join()
+                close(server)
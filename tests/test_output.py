@@ -0,0 +1,36 @@
+import os
+
+from biisan.output import OutputWriter, write_file
+
+
+def test_write_file_skips_same_content(tmp_path):
+    path = tmp_path / 'blog' / 'index.html'
+    assert write_file(str(path), 'こんにちは')
+    assert path.read_text(encoding='utf8') == 'こんにちは'
+    os.utime(str(path), ns=(1, 1))
+
+    assert not write_file(str(path), 'こんにちは')
+    assert path.stat().st_mtime_ns == 1
+
+    assert write_file(str(path), b'changed')
+    assert path.read_bytes() == b'changed'
+    assert path.stat().st_mtime_ns != 1
+    assert os.listdir(str(path.parent)) == ['index.html']
+
+
+def test_output_writer_counts(tmp_path):
+    writer = OutputWriter()
+    path = str(tmp_path / 'index.xml')
+    assert writer.write('feed', path, 'rss')
+    assert not writer.write('feed', path, 'rss')
+    writer.record('story', True)
+    writer.up_to_date('story', 3)
+    assert writer.total(OutputWriter.WRITTEN) == 2
+    assert writer.total(OutputWriter.UNCHANGED) == 1
+    assert writer.total(OutputWriter.UP_TO_DATE) == 3
+    assert writer.report() == [
+        'feed: written=1, unchanged=1, up-to-date=0',
+        'story: written=1, unchanged=0, up-to-date=3',
+    ]
+    writer.reset()
+    assert writer.report() == []
@@ -1,5 +1,7 @@
 from pathlib import Path
 
+import pytest
+
 from biisan.main import (
     initialize_structures,
 )
@@ -50,6 +52,10 @@ def test_processors():
             prepare()
             main()
 
+        with cd('biisan_data/out'):
+            assert (Path('blog') / '2019' / '04' / '06' / 'my_first_blog' / 'index.html').exists()
+            assert (Path('blog') / '2019' / '04' / '15' / 'my_second_blog' / 'index.html').exists()
+
 
 def test_marshal():
     with cd('tests'):
@@ -100,3 +106,768 @@ def test_unmarshal():
         with open(Path('test_data') / 'my_first_blog_output.html') as f:
             tobe_data = f.read()
         assert output_data == tobe_data
+
+
+def test_parse_cache(monkeypatch):
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            import biisan.generate
+            from biisan.generate import prepare, glob_documents
+
+            prepare()
+            first_list = glob_documents('./blog')
+            assert Path('.biisan_cache', 'parse').exists()
+
+            def _fail(pth, data):
+                raise AssertionError('parsed {0} again'.format(pth))
+
+            monkeypatch.setattr(biisan.generate, '_parse_document', _fail)
+            cached_list = glob_documents('./blog')
+            assert [str(x.title) for x in cached_list] == [str(x.title) for x in first_list]
+            assert cached_list[0].source_digest == first_list[0].source_digest
+            assert cached_list[1].other_url == 'https://www.tsuyukimakoto.com/'
+
+
+def test_stat_manifest():
+    import os
+
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+
+        with cd('biisan_data/data'):
+            import biisan.generate
+            from biisan.generate import prepare, glob_documents
+
+            source = Path('blog') / 'my_first_blog.rst'
+            # older than the manifest, so its stat can be trusted
+            os.utime(source, ns=(10 ** 18, 10 ** 18))
+            prepare()
+            assert str(glob_documents('./blog')[0].title) == 'My First Blog'
+            biisan.generate.stat_manifest.save()
+
+            # same size, mtime and inode: the source is not read again
+            text = source.read_text()
+            source.write_text(text.replace('My First Blog', 'My Fir5t Blog', 1))
+            os.utime(source, ns=(10 ** 18, 10 ** 18))
+            prepare()
+            assert str(glob_documents('./blog')[0].title) == 'My First Blog'
+
+            os.utime(source, ns=(10 ** 18 + 1, 10 ** 18 + 1))
+            prepare()
+            assert str(glob_documents('./blog')[0].title) == 'My Fir5t Blog'
+
+
+def test_stat_manifest_with_metadata_scan():
+    import os
+
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+
+        with cd('biisan_data/data'):
+            from biisan.generate import prepare, save_build_state, scan_story_records
+
+            source = Path('blog') / 'my_first_blog.rst'
+            os.utime(source, ns=(10 ** 18, 10 ** 18))
+            prepare()
+            assert scan_story_records('./blog')[0].title == 'My First Blog'
+            save_build_state()
+
+            # the record is taken from the record cache, the source is not read
+            text = source.read_text()
+            source.write_text(text.replace('My First Blog', 'My Fir5t Blog', 1))
+            os.utime(source, ns=(10 ** 18, 10 ** 18))
+            prepare()
+            records = scan_story_records('./blog')
+            assert records[0].title == 'My First Blog'
+            assert records[0].source_file == os.path.join('./blog', 'my_first_blog.rst')
+            save_build_state()
+
+            os.utime(source, ns=(10 ** 18 + 1, 10 ** 18 + 1))
+            prepare()
+            assert scan_story_records('./blog')[0].title == 'My Fir5t Blog'
+
+
+def test_incremental_build(monkeypatch):
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            import biisan.generate
+            from biisan.generate import prepare, main
+            from glueplate import config
+
+            # render in this process so the patched write_html sees every page
+            monkeypatch.setitem(config.settings, 'render_multiprocess', 1)
+            prepare()
+            main()
+
+            rendered = []
+            write_html = biisan.generate.write_html
+
+            def _write_html(story, cached=None):
+                rendered.append(story.slug)
+                return write_html(story, cached)
+
+            monkeypatch.setattr(biisan.generate, 'write_html', _write_html)
+            prepare()
+            main()
+            assert rendered == []
+
+            with open(Path('blog') / 'my_third_blog.rst', 'w') as f:
+                f.write('My Third Blog\n==============\n\n'
+                        ':slug: my_third_blog\n:date: 2019-05-01 10:00\n\nThird!\n')
+            prepare()
+            main()
+            assert sorted(rendered) == ['my_second_blog', 'my_third_blog']
+
+
+def test_unchanged_output_not_rewritten(monkeypatch):
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            import biisan.generate
+            from biisan.generate import prepare, main
+            from biisan.output import OutputWriter
+            from glueplate import config
+
+            monkeypatch.setitem(config.settings, 'incremental', False)
+            prepare()
+            main()
+            out = Path(config.settings.dir.output)
+            mtimes = {x: x.stat().st_mtime_ns for x in out.rglob('*') if x.is_file()}
+
+            prepare()
+            main()
+            assert {x: x.stat().st_mtime_ns for x in out.rglob('*') if x.is_file()} == mtimes
+            writer = biisan.generate.output_writer
+            assert writer.total(OutputWriter.WRITTEN) == 0
+            assert writer.total(OutputWriter.UNCHANGED) > 0
+
+
+def test_output_cache(monkeypatch):
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            import biisan.generate
+            from biisan.cache import OutputCache
+            from biisan.generate import output_cache_path, prepare, main
+            from glueplate import config
+
+            monkeypatch.setitem(config.settings, 'incremental', False)
+            monkeypatch.setitem(config.settings, 'render_multiprocess', 2)
+            prepare()
+            main()
+            out = Path(config.settings.dir.output)
+            pages = sorted(out.glob('blog/*/*/*/*/index.html'))
+            assert len(pages) == 2
+            assert not list(out.rglob('.biisan.raw.sha256'))
+            cache = OutputCache(output_cache_path())
+            assert all(cache.get(str(x)) is not None for x in pages)
+            cache.close()
+
+            minified = []
+            html_minify = biisan.generate.html_minify
+
+            def _html_minify(html):
+                minified.append(html)
+                return html_minify(html)
+
+            monkeypatch.setattr(biisan.generate, 'html_minify', _html_minify)
+            monkeypatch.setitem(config.settings, 'render_multiprocess', 1)
+            prepare()
+            main()
+            assert minified == []
+
+            pages[0].write_text('changed')
+            prepare()
+            main()
+            assert len(minified) == 1
+            assert pages[0].read_text() != 'changed'
+
+
+def test_pools_start_before_threads(monkeypatch):
+    import threading
+
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            import biisan.generate
+            from biisan.generate import prepare, main
+            from glueplate import config
+
+            for i in range(4):
+                with open(Path('blog') / 'pool_{0}.rst'.format(i), 'w') as f:
+                    f.write('Pool {0}\n=============\n\n:slug: pool_{0}\n:date: 2019-0{1}-01 10:00\n'
+                            ':category: cat{0}\n\nBody\n'.format(i, i + 5))
+            threads_at_fork = []
+            start_pool = biisan.generate._start_pool
+
+            def _start_pool(workers):
+                threads_at_fork.append(threading.active_count())
+                return start_pool(workers)
+
+            monkeypatch.setattr(biisan.generate, '_start_pool', _start_pool)
+            monkeypatch.setitem(config.settings, 'render_multiprocess', 2)
+            prepare()
+            main()
+            # the workers collecting the stories render them too
+            assert len(threads_at_fork) == 1
+            assert all(x == 1 for x in threads_at_fork), threads_at_fork
+            assert (Path(config.settings.dir.output) / 'blog' / '2019' / '05' / '01' / 'pool_0' / 'index.html').exists()
+
+
+@pytest.mark.parametrize('start_method', ['fork', 'spawn', 'forkserver'])
+def test_pool_start_methods(monkeypatch, start_method):
+    import multiprocessing
+
+    if start_method not in multiprocessing.get_all_start_methods():
+        pytest.skip('{0} is not available'.format(start_method))
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            import biisan.generate
+            from biisan.generate import prepare, main
+            from glueplate import config
+
+            monkeypatch.setitem(config.settings, 'pool_start_method', start_method)
+            monkeypatch.setitem(config.settings, 'render_multiprocess', 2)
+            # Workers parse every story, with the directives and processors
+            # they registered themselves
+            monkeypatch.setitem(config.settings, 'parse_cache', False)
+            monkeypatch.setitem(config.settings, 'fragment_cache', False)
+            prepare()
+            main()
+            counts = biisan.generate.output_writer.counts['story']
+            assert counts['written'] == 2
+            page = Path(config.settings.dir.output) / 'blog' / '2019' / '04' / '06' / 'my_first_blog' / 'index.html'
+            html = page.read_text()
+            assert 'ノート (2019-04-13)' in html
+            assert 'testasin' in html
+            assert (Path(config.settings.dir.output) / 'blog' / '2019' / '04' / 'index.html').exists()
+
+
+def test_lightweight_stories(monkeypatch):
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            from biisan.generate import prepare, main, glob_story_records
+            from biisan.models import StoryRecord
+            from glueplate import config
+
+            monkeypatch.setitem(config.settings, 'lightweight_stories', True)
+            prepare()
+            record_list = glob_story_records('./blog')
+            assert all(isinstance(x, StoryRecord) for x in record_list)
+            assert record_list[0].title == 'My First Blog'
+            assert record_list[1].url == '/blog/2019/04/15/my_second_blog/'
+            assert record_list[1].other_url == 'https://www.tsuyukimakoto.com/'
+            main()
+
+        with cd('biisan_data/out'):
+            with open(Path('blog') / '2019' / '04' / '15' / 'my_second_blog' / 'index.html') as f:
+                assert '/blog/2019/04/06/my_first_blog/' in f.read()
+            with open(Path('api') / 'feed' / 'index.xml') as f:
+                assert 'My Second Blog' in f.read()
+
+
+def test_index_pages_written_once(monkeypatch):
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            import biisan.generate
+            from biisan.generate import prepare, glob_documents, write_indexes
+            from biisan.story_index import StoryIndex
+            from glueplate import config
+
+            for i, category in enumerate(['python', 'diary', 'python']):
+                with open(Path('blog') / 'category_{0}.rst'.format(i), 'w') as f:
+                    f.write('Category {0}\n=================\n\n'
+                            ':slug: category_{0}\n:date: 2019-0{1}-01 10:00\n'
+                            ':category: {2}\n\nBody\n'.format(i, i + 5, category))
+            monkeypatch.setitem(config.settings, 'render_multiprocess', 2)
+            prepare()
+            story_index = StoryIndex(glob_documents('./blog'))
+            write_indexes(story_index)
+            biisan.generate.build_graph.save()
+            assert biisan.generate._blog_archive_jobs(story_index) == []
+            assert biisan.generate._category_rss20_jobs(story_index.by_category) == []
+
+        with cd('biisan_data/out'):
+            for year_month in ('2019/04', '2019/05', '2019/06', '2019/07'):
+                assert (Path('blog') / year_month / 'index.html').exists()
+            with open(Path('api') / 'feed' / 'python' / 'index.xml') as f:
+                feed = f.read()
+            assert 'Category 0' in feed and 'Category 2' in feed and 'Category 1' not in feed
+
+
+def test_lightweight_stories_without_parse_cache_warns(monkeypatch, caplog):
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+
+        with cd('biisan_data/data'):
+            from biisan.generate import prepare
+            from glueplate import config
+
+            monkeypatch.setitem(config.settings, 'lightweight_stories', True)
+            monkeypatch.setitem(config.settings, 'parse_cache', False)
+            prepare()
+            assert 'parses every rendered story twice' in caplog.text
+
+
+def test_unmarshal_doctree_frontend(monkeypatch):
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+
+        with cd('biisan_data/data'):
+            from biisan.generate import prepare, unmarshal_story, output
+            from glueplate import config
+
+            monkeypatch.setitem(config.settings, 'rst_frontend', 'doctree')
+            prepare()
+            story = unmarshal_story(Path('.') / 'blog' / 'my_first_blog.rst')
+            output([story])
+        with cd('biisan_data/out'):
+            with open(Path('.') / 'blog' / '2019' / '04' / '06' / 'my_first_blog' / 'index.html') as f:
+                output_data = f.read()
+
+        with open(Path('test_data') / 'my_first_blog_output.html') as f:
+            assert output_data == f.read()
+
+
+def _model_attributes(model):
+    attributes = dict(getattr(model, '__dict__', {}))
+    for cls in type(model).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            if hasattr(model, name):
+                attributes[name] = getattr(model, name)
+    return attributes
+
+
+def _dump_model(model):
+    if isinstance(model, list):
+        return [_dump_model(x) for x in model]
+    if type(model).__module__ != 'biisan.models':
+        return model
+    contents = [_dump_model(x) for x in getattr(model, 'contents', [])]
+    attributes = {
+        key: _dump_model(value)
+        for key, value in _model_attributes(model).items()
+        if key != '_body'
+    }
+    return model.__class__.__name__, sorted(attributes.items(), key=repr), contents
+
+
+def test_markdown_direct_frontend_same_as_xml():
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+
+        with cd('biisan_data/data'):
+            from biisan.generate import prepare
+            from biisan.markdown_direct import parse_markdown_to_story
+            from biisan.markdown_processor import parse_markdown_to_xml
+            from biisan.models import Story
+            import biisan.generate
+
+            prepare()
+            with open(Path('..') / '..' / 'test_data' / 'my_markdown_blog.md') as f:
+                data = f.read()
+            expected = Story()
+            biisan.generate.processor_registry.process(parse_markdown_to_xml(data), expected)
+            actual = parse_markdown_to_story(data, Story())
+            assert actual.slug == 'my_markdown_blog'
+            assert actual.tags == "['python', 'markdown']"
+            assert _dump_model(actual) == _dump_model(expected)
+
+
+def test_function_registry_dispatch():
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+
+        import xml.etree.ElementTree as ET
+        from biisan.processors import FunctionRegistry
+
+        calls = []
+
+        def process_note(elm, registry, container):
+            calls.append(('first', elm.tag))
+            for _elm in list(elm):
+                registry.process(_elm, container)
+
+        def process_paragraph(elm, registry, container):
+            calls.append(('first', elm.tag))
+
+        registry = FunctionRegistry()
+        registry.register('process_note', process_note)
+        registry.register('process_paragraph', process_paragraph)
+        note = ET.fromstring('<note><paragraph/><unknown/></note>')
+        registry.process(note, None)
+        assert calls == [('first', 'note'), ('first', 'paragraph')]
+
+        def process_paragraph_again(elm, registry, container):
+            calls.append(('second', elm.tag))
+
+        registry.register('process_paragraph', process_paragraph_again)
+        registry.enable_profile()
+        registry.process(note, None)
+        assert calls[-1] == ('second', 'paragraph')
+        stats = registry.profile_stats()
+        assert sorted(stats) == ['note', 'paragraph']
+        assert stats['note'][0] == 1
+        assert stats['paragraph'][0] == 1
+
+
+def test_paragraph_formated_uses_positions():
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+
+        with cd('biisan_data/data'):
+            from biisan.generate import prepare, _parse_document
+            from biisan.models import Story
+            import biisan.generate
+
+            prepare()
+            story = Story()
+            biisan.generate.processor_registry.process(
+                _parse_document('x.rst', 'a word and **word** then `a <http://example.com/>`_.'),
+                story)
+            paragraph = story.contents[0]
+            expected = ('a word and <strong>word</strong> then '
+                        '<a href="http://example.com/">a</a>.')
+            assert paragraph.formated == expected
+            assert paragraph.formated is paragraph.formated
+            # stories cached without positions fall back to replacing text
+            for content in paragraph.contents:
+                del content.span
+            paragraph.text += ' '
+            assert paragraph.formated != expected
+
+
+def test_native_renderers_same_as_templates(monkeypatch):
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            from biisan.generate import prepare, glob_documents
+            from biisan.markdown_direct import parse_markdown_to_story
+            from biisan.models import Emphasis, HTMLize, Story, Strong
+            from glueplate import config
+            from jinja2 import Environment, FileSystemLoader
+
+            prepare()
+            story_list = glob_documents('./blog')
+            with open(Path('..') / '..' / 'test_data' / 'my_markdown_blog.md') as f:
+                story_list.append(parse_markdown_to_story(f.read(), Story()))
+
+            def render(story):
+                return [content.to_html() for content in story.contents]
+
+            expected = [render(story) for story in story_list]
+            monkeypatch.setitem(config.settings, 'native_renderers', True)
+            assert [render(story) for story in story_list] == expected
+
+            # a component overridden in template_dirs is rendered by its template
+            override_dir = Path('override') / 'components'
+            override_dir.mkdir(parents=True)
+            (override_dir / 'strong.html').write_text('<b>{{ element.text }}</b>')
+            monkeypatch.setattr(HTMLize, 'env', Environment(loader=FileSystemLoader(
+                ['override'] + list(config.settings.template_dirs))))
+            strong = Strong()
+            strong.text = 'word'
+            assert strong.to_html() == '<b>word</b>'
+            assert Emphasis().to_html() == '<italic></italic>'
+
+
+def test_fragment_cache(monkeypatch):
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            from biisan.generate import prepare, main
+            from biisan.models import HTMLize, Paragraph
+            from biisan.utils import get_environment
+            from glueplate import config
+
+            monkeypatch.setitem(config.settings, 'render_multiprocess', 1)
+            monkeypatch.setitem(config.settings, 'template_dirs', [
+                str(Path('templates').absolute())] + list(config.settings.template_dirs))
+            monkeypatch.setattr(HTMLize, 'env', get_environment(config))
+            prepare()
+            main()
+
+            rendered = []
+            to_html = Paragraph.to_html
+
+            def _to_html(self):
+                rendered.append(self)
+                return to_html(self)
+
+            monkeypatch.setattr(Paragraph, 'to_html', _to_html)
+
+            # a layout change re-wraps cached bodies without rendering components
+            base = Path(config.settings.template_dirs[-1]) / 'base.html'
+            Path('templates', 'base.html').write_text(
+                base.read_text().replace('<title>', '<title>new layout '))
+            get_environment(config).cache.clear()
+            prepare()
+            main()
+            assert rendered == []
+            out = Path(config.settings.dir.output)
+            page_path = out / 'blog' / '2019' / '04' / '06' / 'my_first_blog' / 'index.html'
+            with open(page_path) as f:
+                page = f.read()
+            assert 'new layout' in page
+            assert 'paragraph!' in page
+
+
+def test_story_body_follows_template_changes(monkeypatch):
+    import os
+
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+
+        with cd('biisan_data/data'):
+            from biisan.generate import prepare, register_fragment_cache, render_story, unmarshal_story
+            from biisan.models import HTMLize
+            from biisan.utils import get_environment
+            from glueplate import config
+
+            builtin = Path(config.settings.template_dirs[-1]) / 'components' / 'paragraph.html'
+            override = Path('templates', 'components', 'paragraph.html')
+            override.parent.mkdir()
+            override.write_text(builtin.read_text())
+            monkeypatch.setitem(config.settings, 'template_dirs', [
+                str(Path('templates').absolute())] + list(config.settings.template_dirs))
+            monkeypatch.setattr(HTMLize, 'env', get_environment(config))
+            prepare()
+            story = unmarshal_story(Path('blog') / 'my_first_blog.rst')
+            story.prepare_html([story], 0)
+            assert 'edited-paragraph' not in render_story(story)
+
+            # the same story object, as kept by watch and serve
+            override.write_text('<p class="edited-paragraph">{{ element.formated }}</p>')
+            st = override.stat()
+            os.utime(override, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+            register_fragment_cache()
+            assert 'edited-paragraph' in render_story(story)
+
+
+def test_bodies_rendered_while_collecting():
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            import biisan.generate
+            from biisan.generate import prepare, glob_documents
+
+            prepare()
+            story_list = glob_documents('./blog')
+            fragment_cache = biisan.generate.fragment_cache
+            for story in story_list:
+                fragment = fragment_cache.get(fragment_cache.key_for(story.source_digest))
+                assert fragment is not None
+                assert story.body_fragment is None
+            assert 'paragraph!' in ''.join(
+                fragment_cache.get(fragment_cache.key_for(story.source_digest)) for story in story_list)
+
+
+def test_failed_build_stops_rendering(monkeypatch):
+    import threading
+    import time
+
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            import biisan.generate
+            from biisan.generate import prepare, main
+            from glueplate import config
+
+            for i in range(8):
+                with open(Path('blog') / 'stop_{0}.rst'.format(i), 'w') as f:
+                    f.write('Stop {0}\n=============\n\n:slug: stop_{0}\n:date: 2019-05-0{1} 10:00\n\nBody\n'.format(
+                        i, i + 1))
+
+            output_writer = biisan.generate.output_writer
+            record = output_writer.record
+
+            def _record(kind, written):
+                # story pages are still coming in when the index pages fail
+                if kind == 'story':
+                    time.sleep(0.05)
+                return record(kind, written)
+
+            def _write_indexes(story_index):
+                raise RuntimeError('index pages failed')
+
+            monkeypatch.setattr(output_writer, 'record', _record)
+            monkeypatch.setattr(biisan.generate, 'write_indexes', _write_indexes)
+            monkeypatch.setitem(config.settings, 'render_multiprocess', 2)
+            prepare()
+            with pytest.raises(RuntimeError):
+                main()
+            assert not [x for x in threading.enumerate() if x.name == 'biisan-output']
+
+
+def test_discover_documents():
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            from biisan.generate import discover_documents
+
+            Path('blog', '2019').mkdir()
+            Path('blog', '2019', 'nested.md').write_text('# nested')
+            Path('blog', '.drafts').mkdir()
+            Path('blog', '.drafts', 'draft.rst').write_text('draft')
+            Path('blog', '.hidden.rst').write_text('hidden')
+            Path('blog', 'notes.txt').write_text('notes')
+            assert discover_documents('./blog') == [
+                './blog/2019/nested.md',
+                './blog/my_first_blog.rst',
+                './blog/my_second_blog.rst',
+            ]
+
+
+def test_scan_record_same_as_parse():
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            from biisan.generate import prepare, scan_record, scan_story_records, unmarshal_record
+
+            prepare()
+            with open(Path('..') / '..' / 'test_data' / 'my_markdown_blog.md') as f:
+                Path('blog', 'my_markdown_blog.md').write_text(f.read())
+            header = 'Title\n=====\n\n:slug: {0}\n:date: 2019-05-0{1} 10:00\n{2}\nBody\n'
+            # docutils keeps the title and fields in the first of two sections
+            Path('two_sections.rst').write_text(
+                header.format('two_sections', 1, '') + '\nNext\n=====\n\nText\n')
+            assert scan_record('two_sections.rst') is None
+            unreadable = {
+                'markup': '*Title*\n=======\n\n:slug: markup\n:date: 2019-05-02 10:00\n\nBody\n',
+                'link': header.format('link', 3, ':other: see https://example.com/\n'),
+                'multi_line': header.format('multi_line', 4, ':other: first\n  second\n'),
+            }
+            for name, source in unreadable.items():
+                Path('blog', name + '.rst').write_text(source)
+            Path('blog', 'escaped.rst').write_text(header.format(
+                'escaped', 5, ':category: python\n:version: 1\n:other: https\\://example.com/ a\\ b\n'))
+
+            for pth in sorted(Path('blog').iterdir()):
+                scanned = scan_record(pth)
+                assert (scanned is None) == (pth.stem in unreadable)
+                if scanned is not None:
+                    assert vars(scanned) == vars(unmarshal_record(pth))
+            records = scan_story_records('./blog')
+            assert [vars(x) for x in records] == [
+                vars(unmarshal_record(x.source_file)) for x in records]
+            assert records[-1].other == 'https://example.com/ ab'
+
+
+def test_models_have_no_instance_dict():
+    import pickle
+
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+
+        from biisan import models
+
+        node_classes = [
+            cls for cls in vars(models).values()
+            if isinstance(cls, type) and issubclass(cls, models.Document) and cls is not models.Document
+        ]
+        assert len(node_classes) > 30
+        for cls in node_classes:
+            assert not hasattr(cls(), '__dict__'), cls
+
+        empty = models.BulletList()
+        assert empty.contents == []
+        empty.contents.append(models.ListItem())
+        assert len(empty.contents) == 1
+
+        class TaggedStrong(models.Strong):
+            pass
+
+        tagged = TaggedStrong()
+        tagged.tag = 'custom'
+        assert tagged.tag == 'custom'
+
+        section = models.Section()
+        paragraph = models.Paragraph()
+        paragraph.text = 'a strong word'
+        strong = models.Strong()
+        strong.text = 'strong'
+        paragraph.add_content(strong)
+        strong.span = (2, 8)
+        section.add_content(paragraph)
+        nested = models.Section()
+        section.add_content(nested)
+        assert nested.depth == 2
+
+        loaded = pickle.loads(pickle.dumps(section, protocol=pickle.HIGHEST_PROTOCOL))
+        assert loaded.contents[0].formated == 'a <strong>strong</strong> word'
+        assert loaded.contents[0].contents[0].span == (2, 8)
+        assert loaded.contents[1].depth == 2
@@ -0,0 +1,46 @@
+from pathlib import Path
+import xml.etree.ElementTree as ET
+
+from docutils.core import publish_parts
+
+from biisan.rst_processor import (
+    get_engine,
+    parse_rst_to_doctree,
+    parse_rst_to_xml,
+)
+
+
+def _read(entry_file):
+    with open(Path('tests') / 'test_data' / entry_file) as f:
+        return f.read()
+
+
+def test_parse_rst_to_xml_same_as_publish_parts():
+    for entry_file in ('my_first_blog.rst', 'my_second_blog.rst', 'my_first_blog.rst'):
+        data = _read(entry_file)
+        expected = ET.fromstring(publish_parts(data, writer_name='xml')['whole'])
+        assert ET.tostring(parse_rst_to_xml(data)) == ET.tostring(expected)
+
+
+def test_engine_is_reused():
+    overrides = {'report_level': 2, 'halt_level': 6}
+    engine = get_engine(overrides)
+    assert get_engine(dict(overrides)) is engine
+    assert get_engine({'report_level': 3, 'halt_level': 6}) is not engine
+
+
+def _assert_same_element(actual, expected):
+    assert actual.tag == expected.tag
+    assert actual.text == expected.text
+    assert actual.tail == expected.tail
+    assert sorted(actual.items()) == sorted(expected.items())
+    assert list(actual.itertext()) == list(expected.itertext())
+    assert len(actual) == len(expected)
+    for actual_child, expected_child in zip(actual, expected):
+        _assert_same_element(actual_child, expected_child)
+
+
+def test_parse_rst_to_doctree_same_as_xml():
+    for entry_file in ('my_first_blog.rst', 'my_second_blog.rst'):
+        data = _read(entry_file)
+        _assert_same_element(parse_rst_to_doctree(data), parse_rst_to_xml(data))
@@ -0,0 +1,142 @@
+from pathlib import Path
+
+from biisan.main import (
+    initialize_structures,
+)
+
+from ._constants import (
+    ANSWER,
+    DATA_DIR,
+)
+from ._utils import (  # noqa
+    cd,
+    cleanup,
+    copy_first_blog,
+    copy_second_blog,
+    copy_test_local_settings,
+    setenv,
+)
+
+
+def test_site_renders_on_request(monkeypatch):
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            import biisan.generate
+            from biisan.generate import prepare
+            from biisan.serve import Site
+            from biisan.watch import PollingWatcher, watched_directories
+            from glueplate import config
+
+            prepare()
+            site = Site(PollingWatcher(watched_directories(), 0))
+            site.start()
+
+            rendered = []
+            render_story = biisan.generate.render_story
+
+            def _render_story(story):
+                rendered.append(story.slug)
+                return render_story(story)
+
+            monkeypatch.setattr(biisan.generate, 'render_story', _render_story)
+            url = '/blog/2019/04/06/my_first_blog/'
+            content_type, body = site.page(url)
+            assert content_type.startswith('text/html')
+            assert b'My First Blog' in body
+            assert site.page(url)[1] == body
+            assert rendered == ['my_first_blog']
+
+            source = Path('blog') / 'my_first_blog.rst'
+            source.write_text(source.read_text() + '\nServed paragraph.\n')
+            site.refresh()
+            assert b'Served paragraph.' in site.page(url)[1]
+            assert rendered == ['my_first_blog', 'my_first_blog']
+
+            assert b'<rss' in site.page('/api/feed/')[1]
+            assert b'My First Blog' in site.page('/blog/2019/04/')[1]
+            assert site.page('/')[0].startswith('text/html')
+            assert site.page('/about/') is not None
+            assert site.page('/blog/2000/01/') is None
+            assert not Path(config.settings.dir.output, 'blog').exists()
+            site.close()
+
+
+def test_server(monkeypatch):
+    import threading
+    from urllib.error import HTTPError
+    from urllib.request import urlopen
+
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+
+        with cd('biisan_data/data'):
+            from biisan.generate import prepare
+            from biisan.serve import Site, create_server
+
+            prepare()
+            site = Site()
+            site.start()
+            server = create_server(site, port=0)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                base = 'http://127.0.0.1:{0}'.format(server.server_port)
+                with urlopen(base + '/blog/2019/04/06/my_first_blog') as response:
+                    assert response.url.endswith('/my_first_blog/')
+                    assert b'My First Blog' in response.read()
+                try:
+                    urlopen(base + '/missing/')
+                except HTTPError as e:
+                    assert e.code == 404
+                else:
+                    raise AssertionError('expected 404')
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+
+
+def test_site_follows_template_changes(monkeypatch):
+    import os
+
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+
+        with cd('biisan_data/data'):
+            from biisan.generate import prepare
+            from biisan.models import HTMLize
+            from biisan.serve import Site
+            from biisan.utils import get_environment
+            from biisan.watch import PollingWatcher, watched_directories
+            from glueplate import config
+
+            monkeypatch.setitem(config.settings, 'template_dirs', [
+                str(Path('templates').absolute()), config.settings.template_dirs[-1]])
+            monkeypatch.setattr(HTMLize, 'env', get_environment(config))
+            prepare()
+            site = Site(PollingWatcher(watched_directories(), 0))
+            site.start()
+            url = '/blog/2019/04/06/my_first_blog/'
+            assert b'served-paragraph' not in site.page(url)[1]
+
+            override = Path('templates', 'components', 'paragraph.html')
+            override.parent.mkdir()
+            override.write_text('<p class="served-paragraph">{{ element.formated }}</p>')
+            site.refresh()
+            assert b'served-paragraph' in site.page(url)[1]
+
+            override.write_text('<p class="edited-paragraph">{{ element.formated }}</p>')
+            st = override.stat()
+            os.utime(override, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+            site.refresh()
+            assert b'edited-paragraph' in site.page(url)[1]
+            site.close()
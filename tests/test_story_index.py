@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from biisan.story_index import StoryIndex
+
+
+class _Story(object):
+    def __init__(self, slug, date, category=None):
+        self.slug = slug
+        self.date = date
+        self._timestamp = date.timestamp()
+        self.source_file = '{0}.rst'.format(slug)
+        self.source_digest = slug
+        self.additional_meta = {} if category is None else {'category': category}
+
+    def has_additional_meta(self, name):
+        return name in self.additional_meta
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['additional_meta'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+JST = timezone(timedelta(hours=9))
+
+
+def _stories():
+    return [
+        _Story('d', datetime(2020, 2, 1, tzinfo=JST), 'python'),
+        _Story('a', datetime(2019, 12, 31, tzinfo=JST)),
+        _Story('c', datetime(2020, 1, 5, tzinfo=JST), 'python'),
+        _Story('b', datetime(2020, 1, 5, tzinfo=JST), 'diary'),
+        _Story('e', datetime(2020, 2, 1, tzinfo=JST)),
+    ]
+
+
+def test_story_index_order_and_groups():
+    index = StoryIndex(_stories())
+    # same timestamp keeps the input order
+    assert [x.slug for x in index] == ['a', 'c', 'b', 'd', 'e']
+    assert index.year_month == {2019: [12], 2020: [1, 2]}
+    assert list(index.year_month) == [2019, 2020]
+    assert {k: [x.slug for x in v] for k, v in index.by_year_month.items()} == {
+        '2019/12': ['a'], '2020/01': ['c', 'b'], '2020/02': ['d', 'e']}
+    assert {k: [x.slug for x in v] for k, v in index.by_category.items()} == {
+        'python': ['c', 'd'], 'diary': ['b']}
+    assert [x.slug for x in index.by_slug['c']] == ['c']
+    assert [x.slug for x in index.month(2020, 1)] == ['c', 'b']
+    assert index.month(2021, 1) == []
+    assert index.digests == ['a', 'c', 'b', 'd', 'e']
+    assert index.last_modified == datetime(2020, 2, 1, tzinfo=JST)
+
+
+def test_story_index_lookup():
+    index = StoryIndex(_stories())
+    assert [x.slug for x in index.latest(2)] == ['e', 'd']
+    assert [x.slug for x in index.latest(10)] == ['e', 'd', 'b', 'c', 'a']
+    assert index.latest(0) == []
+    assert [x.slug for x in index.between(datetime(2020, 1, 1, tzinfo=JST))] == ['c', 'b', 'd', 'e']
+    assert [x.slug for x in index.between(end=datetime(2020, 2, 1, tzinfo=JST))] == ['a', 'c', 'b']
+    assert [x.slug for x in index.between(
+        datetime(2020, 1, 5, tzinfo=JST), datetime(2020, 1, 6, tzinfo=JST).timestamp())] == ['c', 'b']
+    assert StoryIndex([]).last_modified is None
+
+
+def test_story_index_requires_date():
+    story = _Story('a', datetime(2020, 1, 1, tzinfo=JST))
+    story._timestamp = None
+    with pytest.raises(ValueError):
+        StoryIndex([story])
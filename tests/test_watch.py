@@ -0,0 +1,145 @@
+from pathlib import Path
+
+import pytest
+
+from biisan.main import (
+    initialize_structures,
+)
+
+from ._constants import (
+    ANSWER,
+    DATA_DIR,
+)
+from ._utils import (  # noqa
+    cd,
+    cleanup,
+    copy_first_blog,
+    copy_second_blog,
+    copy_test_local_settings,
+    setenv,
+)
+
+
+def test_polling_watcher(tmp_path):
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        from biisan.watch import PollingWatcher
+
+        (tmp_path / 'a.rst').write_text('a')
+        (tmp_path / 'b.rst').write_text('b')
+        watcher = PollingWatcher([str(tmp_path)])
+        assert watcher.changes() == []
+
+        (tmp_path / 'a.rst').write_text('aa')
+        (tmp_path / 'b.rst').unlink()
+        (tmp_path / 'c.rst').write_text('c')
+        (tmp_path / '.c.rst.swp').write_text('c')
+        assert watcher.changes() == [str(tmp_path / x) for x in ('a.rst', 'b.rst', 'c.rst')]
+        assert watcher.changes() == []
+
+
+def test_inotify_watcher(tmp_path):
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        pytest.importorskip('inotify_simple')
+        from biisan.watch import InotifyWatcher
+
+        (tmp_path / 'a.rst').write_text('a')
+        watcher = InotifyWatcher([str(tmp_path)])
+        try:
+            (tmp_path / 'a.rst').write_text('aa')
+            (tmp_path / 'sub').mkdir()
+            (tmp_path / 'sub' / 'b.rst').write_text('b')
+            assert watcher.wait() == [str(tmp_path / 'a.rst'), str(tmp_path / 'sub' / 'b.rst')]
+        finally:
+            watcher.close()
+
+
+def test_session_rebuilds_changed_story(monkeypatch):
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            import biisan.generate
+            from biisan.generate import prepare
+            from biisan.watch import Session
+            from glueplate import config
+
+            monkeypatch.setitem(config.settings, 'render_multiprocess', 2)
+            prepare()
+            session = Session()
+            try:
+                session.start()
+                pool = session.pool
+                out = Path(config.settings.dir.output)
+                page = out / 'blog' / '2019' / '04' / '06' / 'my_first_blog' / 'index.html'
+                assert page.exists()
+
+                source = Path('blog') / 'my_first_blog.rst'
+                source.write_text(source.read_text() + '\nWatched paragraph.\n')
+                session.update([str(Path('.') / source)])
+                assert 'Watched paragraph.' in page.read_text()
+                counts = biisan.generate.output_writer.counts['story']
+                assert counts['written'] == 1
+                assert session.pool is pool
+
+                third = Path('blog') / 'my_third_blog.rst'
+                third.write_text('My Third Blog\n==============\n\n'
+                                 ':slug: my_third_blog\n:date: 2019-05-01 10:00\n\nThird!\n')
+                session.update([str(Path('.') / third)])
+                assert (out / 'blog' / '2019' / '05' / '01' / 'my_third_blog' / 'index.html').exists()
+
+                session.update([str(Path(config.settings.template_dirs[0]) / 'base.html')])
+                assert session.pool is not pool
+            finally:
+                session.close()
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_session_reloads_templates(monkeypatch, workers):
+    import os
+
+    with cd('tests'):
+        initialize_structures(DATA_DIR, ANSWER)
+        copy_test_local_settings()
+        copy_first_blog()
+        copy_second_blog()
+
+        with cd('biisan_data/data'):
+            from biisan.generate import prepare
+            from biisan.models import HTMLize
+            from biisan.utils import get_environment
+            from biisan.watch import Session
+            from glueplate import config
+
+            monkeypatch.setitem(config.settings, 'render_multiprocess', workers)
+            monkeypatch.setitem(config.settings, 'native_renderers', True)
+            monkeypatch.setitem(config.settings, 'template_dirs', [
+                str(Path('templates').absolute()), config.settings.template_dirs[-1]])
+            monkeypatch.setattr(HTMLize, 'env', get_environment(config))
+            prepare()
+            session = Session()
+            try:
+                session.start()
+                page = Path(config.settings.dir.output) / 'blog' / '2019' / '04' / '06' / 'my_first_blog' / 'index.html'
+                assert 'added-paragraph' not in page.read_text()
+
+                # a new override in front of the built-in template
+                override = Path('templates', 'components', 'paragraph.html')
+                override.parent.mkdir()
+                override.write_text('<p class="added-paragraph">{{ element.formated }}</p>')
+                session.update([str(override.absolute())])
+                assert 'added-paragraph' in page.read_text()
+
+                override.write_text('<p class="edited-paragraph">{{ element.formated }}</p>')
+                st = override.stat()
+                os.utime(override, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+                session.update([str(override.absolute())])
+                assert 'edited-paragraph' in page.read_text()
+            finally:
+                session.close()